@@ -6,16 +6,34 @@ import asyncio
 import aiohttp
 import aiosqlite
 import json
+import logging
 import os
 import secrets
+import signal
+import socket
 import time
 import io
 import math
+import hashlib
+import re
 import zipfile
+import gzip
+import zlib
+import struct
+import functools
+import itertools
+import contextlib
+import multiprocessing
+import multiprocessing.connection
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from email.utils import formatdate
 from PIL import Image, ImageDraw, ImageFont
 from urllib.parse import quote
-from pypinyin import pinyin, Style
-from dotenv import load_dotenv
+from pypinyin import pinyin, lazy_pinyin, Style
+from dotenv import dotenv_values, load_dotenv
 
 load_dotenv()
 
@@ -28,6 +46,9 @@ DEFAULT_SETTINGS = {
     "singer_intro": "这里填写歌手介绍~",
 }
 
+logger = logging.getLogger("qqzhu")
+
+
 class CaseSensitiveConfigParser(configparser.ConfigParser):
     def optionxform(self, optionstr):
         return optionstr
@@ -36,11 +57,29 @@ class CaseSensitiveConfigParser(configparser.ConfigParser):
 class Config:
     """负责读取和管理配置文件的类。"""
 
-    def __init__(self, filename="config.ini"):
+    def __init__(self, filename="config.ini", env_path=".env"):
         self.config = CaseSensitiveConfigParser()
         self.config.read(filename)
         # cache env overrides
         self.env_admin_token = os.environ.get("QQZHU_ADMIN_TOKEN")
+        self.env_path = env_path
+        self._env_mtime = self._env_file_mtime()
+
+    def _env_file_mtime(self):
+        try:
+            return os.stat(self.env_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload_env_admin_token(self):
+        """Re-read QQZHU_ADMIN_TOKEN when .env changed on disk, e.g. updated by another worker."""
+        mtime = self._env_file_mtime()
+        if mtime is None or mtime == self._env_mtime:
+            return
+        self._env_mtime = mtime
+        token = dotenv_values(self.env_path).get("QQZHU_ADMIN_TOKEN")
+        if token:
+            self.env_admin_token = token
 
     def _get(self, section, key, default):
         if self.config.has_section(section) and key in self.config[section]:
@@ -50,6 +89,17 @@ class Config:
     def db_path(self):
         return os.environ.get("QQZHU_DB_PATH") or self._get("database", "path", "instance/qqzhu.db")
 
+    def database_options(self):
+        """SQLite 连接参数：只读连接数（0 表示读写共用一个连接）、页缓存与 mmap 大小、锁等待时间。"""
+        return {
+            "read_connections": int(
+                os.environ.get("QQZHU_DB_READERS") or self._get("database", "read_connections", 4)
+            ),
+            "cache_size_mb": int(self._get("database", "cache_size_mb", 16)),
+            "mmap_size_mb": int(self._get("database", "mmap_size_mb", 128)),
+            "busy_timeout_ms": int(self._get("database", "busy_timeout_ms", 5000)),
+        }
+
     def server_port(self):
         env_port = os.environ.get("QQZHU_PORT")
         if env_port:
@@ -57,36 +107,217 @@ class Config:
         return int(self._get("server", "port", 8080))
 
     def admin_token(self):
+        self.reload_env_admin_token()
         return self.env_admin_token or self._get("server", "admin_token", "")
 
-
-LOGIN_ATTEMPTS = {}
+    def workers(self):
+        """worker 进程数：大于 1 时由主进程拉起多个进程共用端口（SO_REUSEPORT）。"""
+        return int(os.environ.get("QQZHU_WORKERS") or self._get("server", "workers", 1))
+
+    def image_proxy_options(self):
+        """/proxy-image 的缓存与上游限制，可在 [proxy] 段配置。"""
+        return {
+            "cache_dir": os.environ.get("QQZHU_IMAGE_CACHE_DIR")
+            or self._get("proxy", "cache_dir", "instance/image_cache"),
+            "memory_bytes": int(self._get("proxy", "memory_cache_mb", 32)) * 1024 * 1024,
+            "disk_bytes": int(self._get("proxy", "disk_cache_mb", 512)) * 1024 * 1024,
+            "default_ttl": int(self._get("proxy", "default_ttl", 3600)),
+            "max_body": int(self._get("proxy", "max_image_mb", 10)) * 1024 * 1024,
+            "timeout": float(self._get("proxy", "timeout", 15)),
+            "connections": int(self._get("proxy", "connections", 32)),
+        }
+
+    def render_options(self):
+        """歌单图片渲染池：executor 为 process 或 thread，workers 为并发数，max_queue 为排队上限。"""
+        return {
+            "executor": os.environ.get("QQZHU_RENDER_EXECUTOR") or self._get("render", "executor", "process"),
+            "workers": int(os.environ.get("QQZHU_RENDER_WORKERS") or self._get("render", "workers", 2)),
+            "max_queue": int(self._get("render", "max_queue", 4)),
+            "preload_font_sizes": [
+                int(size)
+                for size in self._get("render", "preload_font_sizes", "").replace(",", " ").split()
+            ],
+            "max_image_height": int(self._get("render", "max_image_height", LONG_IMAGE_MAX_HEIGHT)),
+            "jobs_dir": self._get("render", "jobs_dir", "instance/jobs"),
+            "job_ttl": int(self._get("render", "job_ttl", 86400)),
+        }
+
+    def virtual_render_threshold(self):
+        """超过该歌曲数时首页改为按需渲染（虚拟列表），0 表示始终全量渲染。"""
+        env_value = os.environ.get("QQZHU_VIRTUAL_THRESHOLD")
+        if env_value:
+            return int(env_value)
+        return int(self._get("server", "virtual_threshold", 1000))
+
+
+# 登录失败记录存在 SQLite（login_failures 表），多个 worker 共用同一个限额
 LOGIN_LIMIT = 5
 LOGIN_WINDOW = 300  # seconds
 
 
-def _login_attempts_info(ip: str):
+async def _login_attempts_info(conn, ip: str):
     now = time.time()
-    attempts = LOGIN_ATTEMPTS.get(ip, [])
-    attempts = [t for t in attempts if now - t < LOGIN_WINDOW]
-    LOGIN_ATTEMPTS[ip] = attempts
-    remaining = max(LOGIN_LIMIT - len(attempts), 0)
+    cursor = await conn.execute(
+        "SELECT COUNT(*) AS attempts, MIN(failed_at) AS first FROM login_failures WHERE ip = ? AND failed_at > ?",
+        (ip, now - LOGIN_WINDOW),
+    )
+    row = await cursor.fetchone()
+    await cursor.close()
+    remaining = max(LOGIN_LIMIT - row["attempts"], 0)
     wait = 0
-    if remaining == 0 and attempts:
-        wait = max(0, int(LOGIN_WINDOW - (now - attempts[0])))
+    if remaining == 0 and row["first"] is not None:
+        wait = max(0, int(LOGIN_WINDOW - (now - row["first"])))
     return remaining, wait
 
 
-def _add_login_failure(ip: str):
+async def _add_login_failure(conn, ip: str):
+    """Record a failed login (caller holds app["write_lock"]); expired rows of every ip are dropped on the way."""
     now = time.time()
-    attempts = LOGIN_ATTEMPTS.get(ip, [])
-    attempts = [t for t in attempts if now - t < LOGIN_WINDOW]
-    attempts.append(now)
-    LOGIN_ATTEMPTS[ip] = attempts
+    try:
+        await conn.execute("DELETE FROM login_failures WHERE failed_at <= ?", (now - LOGIN_WINDOW,))
+        await conn.execute("INSERT INTO login_failures (ip, failed_at) VALUES (?, ?)", (ip, now))
+        await conn.commit()
+    except BaseException:
+        await conn.rollback()
+        raise
 
 
-def _reset_login_failure(ip: str):
-    LOGIN_ATTEMPTS.pop(ip, None)
+async def _reset_login_failure(conn, ip: str):
+    try:
+        await conn.execute("DELETE FROM login_failures WHERE ip = ?", (ip,))
+        await conn.commit()
+    except BaseException:
+        await conn.rollback()
+        raise
+
+
+# 进程内歌单快照：songs/settings 写入时递增 version，首页按 version 复用快照
+CATALOG_CACHE = {
+    "version": 0,
+    "updated_at": time.time(),
+    "snapshot": None,
+    "hits": 0,
+    "misses": 0,
+}
+_CATALOG_LOCK = asyncio.Lock()
+
+# 首页 HTML / 歌单 JSON 按 catalog version 缓存，附带 ETag / Last-Modified 供条件请求使用
+PAGE_CACHE = {
+    "entries": {},
+    "hits": 0,
+    "misses": 0,
+    "not_modified": 0,
+}
+CATALOG_JSON_CACHE = {
+    "entries": {},
+    "hits": 0,
+    "misses": 0,
+    "not_modified": 0,
+}
+CATALOG_FIELDS = ("id", "name", "artist", "language", "genre", "url")
+# 增量同步：写入歌曲时记下本次事务提交后的版本号（bump_catalog_version 在同一事务内 +1），
+# 删除留下墓碑；墓碑保留 TOMBSTONE_RETENTION 秒，更早的客户端只能整表重置
+PENDING_VERSION_SQL = "(SELECT version + 1 FROM catalog_meta WHERE id = 1)"
+TOMBSTONE_RETENTION = 30 * 86400
+
+# 站点设置读多写少：读取走进程内缓存，update_settings 写入后清空；
+# generation 防止写入前发起的读取把旧值放回缓存
+SETTINGS_CACHE = {
+    "settings": None,
+    "generation": 0,
+    "hits": 0,
+    "misses": 0,
+}
+
+
+async def bump_catalog_version(conn):
+    """Advance the shared catalog version inside the caller's write transaction.
+
+    The version lives in catalog_meta so every worker process sees the change
+    once it commits; refresh_catalog_version picks it up on the next read.
+    Expired tombstones are pruned in the same transaction.
+    """
+    await prune_song_tombstones(conn)
+    await conn.execute("UPDATE catalog_meta SET version = version + 1, updated_at = ? WHERE id = 1", (time.time(),))
+
+
+async def prune_song_tombstones(conn, retention=TOMBSTONE_RETENTION):
+    """Drop tombstones older than ``retention`` seconds and raise changes_from past them."""
+    cursor = await conn.execute(
+        "SELECT MAX(version) FROM song_tombstones WHERE deleted_at < ?", (time.time() - retention,)
+    )
+    row = await cursor.fetchone()
+    await cursor.close()
+    if row[0] is None:
+        return
+    await conn.execute("DELETE FROM song_tombstones WHERE version <= ?", (row[0],))
+    # 比被清理的删除更早的版本已无法给出完整增量，这些客户端需要重置
+    await conn.execute("UPDATE catalog_meta SET changes_from = MAX(changes_from, ?) WHERE id = 1", (row[0],))
+
+
+async def refresh_catalog_version(conn):
+    """Sync CATALOG_CACHE with catalog_meta; drops cached settings when another write moved the version."""
+    cursor = await conn.execute("SELECT version, updated_at FROM catalog_meta WHERE id = 1")
+    row = await cursor.fetchone()
+    await cursor.close()
+    if row is None or row["version"] == CATALOG_CACHE["version"]:
+        return
+    CATALOG_CACHE["version"] = row["version"]
+    CATALOG_CACHE["updated_at"] = row["updated_at"]
+    # 站点信息的修改同样会推进版本号，可能来自其他 worker
+    invalidate_settings_cache()
+
+
+def catalog_cache_stats():
+    snapshot = CATALOG_CACHE["snapshot"]
+    return {
+        "version": CATALOG_CACHE["version"],
+        "hits": CATALOG_CACHE["hits"],
+        "misses": CATALOG_CACHE["misses"],
+        "snapshot_version": snapshot["version"] if snapshot else None,
+        "built_at": snapshot["built_at"] if snapshot else None,
+        "songs": len(snapshot["songs"]) if snapshot else 0,
+    }
+
+
+def invalidate_settings_cache():
+    SETTINGS_CACHE["settings"] = None
+    SETTINGS_CACHE["generation"] += 1
+
+
+def settings_cache_stats():
+    return {
+        "hits": SETTINGS_CACHE["hits"],
+        "misses": SETTINGS_CACHE["misses"],
+        "cached": SETTINGS_CACHE["settings"] is not None,
+    }
+
+
+def response_cache_stats(cache):
+    return {
+        "hits": cache["hits"],
+        "misses": cache["misses"],
+        "not_modified": cache["not_modified"],
+        "entries": {
+            key: {"version": entry["version"], "bytes": len(entry["body"])}
+            for key, entry in cache["entries"].items()
+        },
+    }
+
+
+def is_not_modified(request, etag, last_modified):
+    """Evaluate If-None-Match / If-Modified-Since against the cached entry."""
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        # If-None-Match 存在时忽略 If-Modified-Since（RFC 9110）
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or any(
+            (tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates
+        )
+    if_modified_since = request.if_modified_since
+    if if_modified_since is not None:
+        return int(last_modified) <= if_modified_since.timestamp()
+    return False
 
 
 def update_env_var(key: str, value: str, env_path: str = ".env"):
@@ -103,8 +334,11 @@ def update_env_var(key: str, value: str, env_path: str = ".env"):
                     lines.append(line)
     if not found:
         lines.append(f"{key}={value}\n")
-    with open(env_path, "w", encoding="utf-8") as f:
+    # 整体替换，其他 worker 读 .env 时不会读到写了一半的文件
+    tmp_path = f"{env_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
         f.writelines(lines)
+    os.replace(tmp_path, env_path)
     # Also update process env for current runtime
     os.environ[key] = value
 
@@ -157,19 +391,112 @@ async def security_headers_middleware(request, handler):
     return response
 
 
-async def create_db_connection(db_path):
+async def configure_connection(conn, options):
+    conn.row_factory = aiosqlite.Row
+    await conn.execute(f"PRAGMA busy_timeout = {int(options['busy_timeout_ms'])}")
+    await conn.execute("PRAGMA synchronous = NORMAL")
+    # 负数表示以 KiB 为单位
+    await conn.execute(f"PRAGMA cache_size = {-int(options['cache_size_mb']) * 1024}")
+    await conn.execute(f"PRAGMA mmap_size = {int(options['mmap_size_mb']) * 1024 * 1024}")
+    await conn.execute("PRAGMA temp_store = MEMORY")
+
+
+async def create_db_connection(db_path, options):
+    """Open the writer connection: switches the database to WAL and creates the schema."""
     # Ensure the database directory exists before connecting
     db_dir = os.path.dirname(db_path)
     if db_dir:
         os.makedirs(db_dir, exist_ok=True)
     conn = await aiosqlite.connect(db_path)
-    conn.row_factory = aiosqlite.Row
-    await ensure_tables(conn)
+    try:
+        # WAL 下读连接看到的是最近一次提交的快照，不会被写事务（如恢复备份）阻塞
+        await conn.execute("PRAGMA journal_mode = WAL")
+        await configure_connection(conn, options)
+        await ensure_tables(conn)
+    except BaseException:
+        await conn.close()
+        raise
     return conn
 
 
+class ReadPool:
+    """Read-only connections for page and API reads, kept apart from the writer.
+
+    aiosqlite runs every call of a connection on that connection's own
+    thread, so reads on the writer queue up behind a long restore. With WAL
+    the readers proceed concurrently and see the last committed state. With
+    no readers (size 0 or an in-memory database) ``acquire`` hands out the
+    writer. ``acquire(snapshot=True)`` wraps the block in a read transaction
+    so several queries see one committed state (not on the shared writer).
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self._conns = []
+        self._idle = asyncio.Queue()
+        self.acquired = 0
+        self.waited = 0
+
+    @classmethod
+    async def open(cls, writer, db_path, size, options):
+        pool = cls(writer)
+        if db_path == ":memory:" or db_path.startswith("file:"):
+            return pool
+        uri = "file:" + quote(os.path.abspath(db_path)) + "?mode=ro"
+        try:
+            for _ in range(size):
+                conn = await aiosqlite.connect(uri, uri=True)
+                pool._conns.append(conn)
+                await configure_connection(conn, options)
+                pool._idle.put_nowait(conn)
+        except BaseException:
+            await pool.close()
+            raise
+        return pool
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, snapshot=False):
+        if not self._conns:
+            yield self.writer
+            return
+        self.acquired += 1
+        if self._idle.empty():
+            self.waited += 1
+        conn = await self._idle.get()
+        try:
+            if not snapshot:
+                yield conn
+                return
+            await conn.execute("BEGIN")
+            try:
+                yield conn
+            finally:
+                await conn.rollback()
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        for conn in self._conns:
+            await conn.close()
+        self._conns = []
+
+    def stats(self):
+        return {
+            "size": len(self._conns),
+            "idle": self._idle.qsize(),
+            "acquired": self.acquired,
+            "waited": self.waited,
+        }
+
+
 async def ensure_tables(conn):
-    """Create required tables if they do not exist."""
+    """Bring the schema up to date, then make sure the search index matches songs."""
+    await run_migrations(conn)
+    await sync_search_index(conn)
+    await conn.commit()
+
+
+async def create_base_tables(conn):
     await conn.execute(
         """
         CREATE TABLE IF NOT EXISTS songs (
@@ -178,12 +505,48 @@ async def ensure_tables(conn):
             artist TEXT NOT NULL,
             language TEXT NOT NULL,
             genre TEXT NOT NULL,
-            url TEXT NOT NULL
+            url TEXT NOT NULL,
+            sort_priority INTEGER NOT NULL DEFAULT 1,
+            sort_length INTEGER NOT NULL DEFAULT 0,
+            sort_name TEXT
         )
         """
     )
     await ensure_settings_table(conn)
-    await conn.commit()
+
+
+async def create_song_indexes(conn):
+    """Indexes for DISTINCT language/genre, artist filters and name + artist lookups (cf. song_merge_key)."""
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_songs_language ON songs (language)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_songs_genre ON songs (genre)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_songs_artist ON songs (artist)")
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_songs_name_artist ON songs (lower(trim(name)), lower(trim(artist)))"
+    )
+
+
+async def ensure_sort_columns(conn):
+    """Add precomputed sort key columns to older databases and backfill them."""
+    cursor = await conn.execute("PRAGMA table_info(songs)")
+    columns = {row["name"] for row in await cursor.fetchall()}
+    await cursor.close()
+    if "sort_priority" not in columns:
+        await conn.execute("ALTER TABLE songs ADD COLUMN sort_priority INTEGER NOT NULL DEFAULT 1")
+    if "sort_length" not in columns:
+        await conn.execute("ALTER TABLE songs ADD COLUMN sort_length INTEGER NOT NULL DEFAULT 0")
+    if "sort_name" not in columns:
+        await conn.execute("ALTER TABLE songs ADD COLUMN sort_name TEXT")
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_songs_sort ON songs (sort_priority, sort_length, sort_name, id)"
+    )
+    cursor = await conn.execute("SELECT id, name, language FROM songs WHERE sort_name IS NULL")
+    rows = await cursor.fetchall()
+    await cursor.close()
+    if rows:
+        await conn.executemany(
+            "UPDATE songs SET sort_priority = ?, sort_length = ?, sort_name = ? WHERE id = ?",
+            [(*compute_sort_key(row["name"], row["language"]), row["id"]) for row in rows],
+        )
 
 
 async def ensure_settings_table(conn):
@@ -195,13 +558,176 @@ async def ensure_settings_table(conn):
         )
         """
     )
-    await conn.commit()
+
+
+async def create_search_table(conn):
+    await conn.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(
+            name, artist, genre, language, name_pinyin, name_initials,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """
+    )
+
+
+async def sync_search_index(conn):
+    """Rebuild the FTS5 search table when it is out of sync with songs."""
+    cursor = await conn.execute(
+        "SELECT (SELECT COUNT(*) FROM songs) AS songs, (SELECT COUNT(*) FROM songs_fts) AS indexed"
+    )
+    row = await cursor.fetchone()
+    await cursor.close()
+    if row["songs"] == row["indexed"]:
+        return
+    await conn.execute("DELETE FROM songs_fts")
+    cursor = await conn.execute("SELECT id, name, artist, language, genre FROM songs")
+    rows = await cursor.fetchall()
+    await cursor.close()
+    await conn.executemany(
+        SEARCH_INSERT_SQL,
+        [song_search_row(r["id"], r["name"], r["artist"], r["language"], r["genre"]) for r in rows],
+    )
+
+
+async def create_catalog_meta(conn):
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS catalog_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """
+    )
+    await conn.execute("INSERT OR IGNORE INTO catalog_meta (id, version, updated_at) VALUES (1, 0, ?)", (time.time(),))
+
+
+async def create_change_log(conn):
+    """songs.updated_version, song_tombstones and catalog_meta.changes_from for /api/songs/changes.
+
+    Existing songs are stamped with a fresh version and changes_from moves to
+    it, so clients holding an older version get a full reset once.
+    """
+    cursor = await conn.execute("PRAGMA table_info(songs)")
+    columns = {row["name"] for row in await cursor.fetchall()}
+    await cursor.close()
+    if "updated_version" not in columns:
+        await conn.execute("ALTER TABLE songs ADD COLUMN updated_version INTEGER NOT NULL DEFAULT 0")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_songs_updated_version ON songs (updated_version)")
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS song_tombstones (
+            id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            deleted_at REAL NOT NULL
+        )
+        """
+    )
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_song_tombstones_version ON song_tombstones (version)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_song_tombstones_deleted_at ON song_tombstones (deleted_at)")
+    cursor = await conn.execute("PRAGMA table_info(catalog_meta)")
+    columns = {row["name"] for row in await cursor.fetchall()}
+    await cursor.close()
+    if "changes_from" not in columns:
+        await conn.execute("ALTER TABLE catalog_meta ADD COLUMN changes_from INTEGER NOT NULL DEFAULT 0")
+        await conn.execute(
+            "UPDATE catalog_meta SET version = version + 1, changes_from = version + 1, updated_at = ? WHERE id = 1",
+            (time.time(),),
+        )
+        await conn.execute("UPDATE songs SET updated_version = (SELECT version FROM catalog_meta WHERE id = 1)")
+
+
+async def create_login_failures(conn):
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS login_failures (
+            ip TEXT NOT NULL,
+            failed_at REAL NOT NULL
+        )
+        """
+    )
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_login_failures_ip ON login_failures (ip, failed_at)")
+
+
+# 数据库结构迁移：按编号顺序执行，已执行到的编号记在 PRAGMA user_version。
+# 每个迁移都要可重复执行（IF NOT EXISTS / 先检查列），以兼容引入迁移之前建好的库；
+# 新迁移只能追加到末尾，不要修改已发布的迁移
+MIGRATIONS = [
+    (1, "创建 songs 与 site_settings 表", create_base_tables),
+    (2, "添加排序键列", ensure_sort_columns),
+    (3, "创建全文搜索表", create_search_table),
+    (4, "添加 language / genre / artist / 歌名+歌手 索引", create_song_indexes),
+    (5, "创建 catalog_meta 表（跨进程共享的歌单版本号）", create_catalog_meta),
+    (6, "记录歌曲修改版本与删除墓碑（增量同步）", create_change_log),
+    (7, "创建 login_failures 表（跨进程共享的登录失败计数）", create_login_failures),
+]
+
+
+async def schema_version(conn):
+    cursor = await conn.execute("PRAGMA user_version")
+    row = await cursor.fetchone()
+    await cursor.close()
+    return row[0]
+
+
+async def run_migrations(conn):
+    """Apply pending MIGRATIONS, each in its own transaction together with the user_version bump."""
+    current = await schema_version(conn)
+    latest = MIGRATIONS[-1][0]
+    if current > latest:
+        logger.warning("数据库版本 %d 高于程序支持的 %d，跳过迁移", current, latest)
+        return
+    if current == latest:
+        logger.info("数据库结构已是最新（版本 %d）", current)
+        return
+    if conn.in_transaction:
+        await conn.commit()
+    for version, description, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        started = time.perf_counter()
+        await conn.execute("BEGIN IMMEDIATE")
+        # 多个 worker 同时启动时，拿到写锁后再确认一次是否已被别的进程执行过
+        if await schema_version(conn) >= version:
+            await conn.commit()
+            continue
+        try:
+            await migration(conn)
+            await conn.execute(f"PRAGMA user_version = {int(version)}")
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            logger.exception("数据库迁移 %d（%s）失败，已回滚", version, description)
+            raise
+        logger.info(
+            "数据库迁移 %d（%s）完成，用时 %.1f ms", version, description, (time.perf_counter() - started) * 1000
+        )
 
 
 def ensure_upload_dir():
     os.makedirs("static/uploads", exist_ok=True)
 
 
+@contextlib.contextmanager
+def atomic_output(path):
+    """Open ``path`` for binary writing via a temp file that replaces it only on success."""
+    tmp_path = f"{path}.{os.getpid()}.{secrets.token_hex(4)}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def write_bytes(path, data):
+    with atomic_output(path) as f:
+        f.write(data)
+
+
 def save_file_field(file_field, prefix):
     """Save aiohttp FileField to static/uploads and return web path."""
     ensure_upload_dir()
@@ -217,8 +743,7 @@ def save_file_field(file_field, prefix):
     return f"/static/uploads/{safe_name}"
 
 
-def pick_font(font_path=None, size=38):
-    """Pick a font that exists on the system."""
+def font_candidates(font_path=None):
     env_font = os.environ.get("QQZHU_FONT_PATH")
     candidates = []
     if font_path:
@@ -245,63 +770,414 @@ def pick_font(font_path=None, size=38):
             "STHeiti Light.ttc",
         ]
     )
+    return candidates
+
+
+# 字体按 (path, size) 缓存，候选路径探测结果按 (font_path, QQZHU_FONT_PATH) 记住；
+# 每个渲染进程各有一份，重复渲染不再重新加载 .ttc
+_RESOLVED_FONT_PATHS = {}
+
+
+@functools.lru_cache(maxsize=32)
+def load_font(path, size):
+    return ImageFont.truetype(path, size)
 
-    for path in candidates:
+
+def resolve_font_path(font_path=None, size=38):
+    key = (font_path, os.environ.get("QQZHU_FONT_PATH"))
+    if key in _RESOLVED_FONT_PATHS:
+        return _RESOLVED_FONT_PATHS[key]
+    resolved = None
+    for path in font_candidates(font_path):
         if not path or not os.path.exists(path):
             continue
         try:
-            return ImageFont.truetype(path, size)
+            load_font(path, size)
         except Exception:
             continue
+        resolved = path
+        break
+    _RESOLVED_FONT_PATHS[key] = resolved
+    return resolved
+
+
+def pick_font(font_path=None, size=38):
+    """Pick a font that exists on the system."""
+    path = resolve_font_path(font_path, size)
+    if path:
+        try:
+            return load_font(path, size)
+        except Exception:
+            pass
     font = ImageFont.load_default()
     font.size = size
     return font
 
 
-def wrap_song_names(names, max_chars_per_line=35, max_songs_per_line=6):
+def preload_fonts(sizes, font_path=None):
+    """Warm the font cache (used at startup and as the render worker initializer)."""
+    for size in sizes:
+        pick_font(font_path, size)
+    return resolve_font_path(font_path)
+
+
+class FontMetrics:
+    """Glyph metrics cache for one font: advance width and vertical ink extent per character.
+
+    Text width is the sum of advances and text height is the union of glyph
+    boxes, which matches ``textbbox`` for the basic layout without drawing
+    anything; each distinct character is measured once per font.
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self._glyphs = {}
+        self.hits = 0
+        self.misses = 0
+
+    def glyph(self, char):
+        glyph = self._glyphs.get(char)
+        if glyph is None:
+            self.misses += 1
+            _, top, _, bottom = self.font.getbbox(char)
+            glyph = self._glyphs[char] = (self.font.getlength(char), top, bottom)
+        else:
+            self.hits += 1
+        return glyph
+
+    def width(self, text):
+        return sum(self.glyph(char)[0] for char in text)
+
+    def height(self, text):
+        glyphs = [self.glyph(char) for char in text]
+        if not glyphs:
+            return 0
+        return max(g[2] for g in glyphs) - min(g[1] for g in glyphs)
+
+
+@functools.lru_cache(maxsize=32)
+def font_metrics(font):
+    return FontMetrics(font)
+
+
+SONG_SEPARATOR = "  "
+
+
+def layout_song_lines(names, font, max_width, max_songs_per_line=6, max_chars_per_line=None, max_lines=None):
+    """Pack song names into lines by rendered pixel width.
+
+    Returns ``(text, width, height)`` per line so drawing never re-measures.
+    ``max_chars_per_line`` is an optional extra cap; a name wider than
+    ``max_width`` on its own still gets its own line. ``max_lines`` stops
+    early (used by previews).
+    """
+    metrics = font_metrics(font)
+    sep_width = metrics.width(SONG_SEPARATOR)
     lines = []
     current = []
+    current_width = 0
     current_chars = 0
+
+    def flush():
+        text = SONG_SEPARATOR.join(current)
+        lines.append((text, current_width, metrics.height(text)))
+
     for name in names:
-        name_len = len(name)
-        if current and (current_chars + name_len > max_chars_per_line or len(current) >= max_songs_per_line):
-            lines.append("  ".join(current))
+        name_width = metrics.width(name)
+        if current and (
+            current_width + sep_width + name_width > max_width
+            or len(current) >= max_songs_per_line
+            or (max_chars_per_line and current_chars + len(name) > max_chars_per_line)
+        ):
+            flush()
+            if max_lines and len(lines) >= max_lines:
+                return lines
             current = []
+            current_width = 0
             current_chars = 0
+        if current:
+            current_width += sep_width
+            current_chars += len(SONG_SEPARATOR)
         current.append(name)
-        current_chars += name_len + 2
+        current_width += name_width
+        current_chars += len(name)
     if current:
-        lines.append("  ".join(current))
+        flush()
     return lines
 
 
-def combine_background_img(head_img, content_img, end_img, output_height):
-    head_h = head_img.height
-    content_h = content_img.height
-    end_h = end_img.height
-    width = head_img.width
-    combined = Image.new("RGB", (width, output_height))
-    combined.paste(head_img, (0, 0))
-    content_area_h = output_height - head_h - end_h
-    blocks = max(content_area_h // content_h, 0)
-    for i in range(blocks + 1):
-        y = head_h + i * content_h
-        if y >= output_height - end_h:
-            break
-        combined.paste(content_img, (0, y))
-    combined.paste(end_img, (0, output_height - end_h))
-    return combined
+# 输出格式：ext 为文件扩展名，max_side 为该格式单张图片允许的最大边长
+OUTPUT_FORMATS = {
+    "png": {"ext": "png", "max_side": 2**31 - 1},
+    "jpeg": {"ext": "jpg", "max_side": 65500},
+    "webp": {"ext": "webp", "max_side": 16383},
+    "webp_lossless": {"ext": "webp", "max_side": 16383},
+}
+DEFAULT_QUALITY = {"jpeg": 90, "webp": 85}
+MIN_QUALITY = 30
+PNG_OVER_BUDGET_HINT = "PNG 为无损格式，已按最高压缩仍超出目标大小，可改用 JPEG 或 WebP"
+
+
+def encode_image(img, output_format="png", compress_level=6, target_bytes=None):
+    """Encode ``img``; for lossy formats with ``target_bytes`` binary-search the highest quality that fits.
+
+    PNG cannot trade quality for size: over budget it is re-encoded with
+    ``optimize`` (maximum compression) and, if still too big, the info carries
+    a ``hint`` to use a lossy format. Returns ``(data, info)`` where info has
+    format, quality, bytes, encode_ms and within_budget.
+    """
+    started = time.perf_counter()
+
+    def save(quality=None, optimize=False):
+        buf = io.BytesIO()
+        if output_format == "png":
+            img.save(buf, format="PNG", compress_level=compress_level, optimize=optimize)
+        elif output_format == "jpeg":
+            img.save(buf, format="JPEG", quality=quality, progressive=True, optimize=True)
+        elif output_format == "webp":
+            img.save(buf, format="WEBP", quality=quality, method=4)
+        else:
+            img.save(buf, format="WEBP", lossless=True, quality=80, method=4)
+        return buf.getvalue()
+
+    quality = DEFAULT_QUALITY.get(output_format)
+    data = save(quality)
+    if output_format == "png" and target_bytes and len(data) > target_bytes:
+        data = min(data, save(optimize=True), key=len)
+    if quality and target_bytes and len(data) > target_bytes:
+        low, high = MIN_QUALITY, quality - 1
+        best = None
+        while low <= high:
+            mid = (low + high) // 2
+            candidate = save(mid)
+            if len(candidate) <= target_bytes:
+                best = (mid, candidate)
+                low = mid + 1
+            else:
+                high = mid - 1
+                data, quality = candidate, mid
+        if best:
+            quality, data = best
+    info = {
+        "format": output_format,
+        "quality": quality,
+        "bytes": len(data),
+        "encode_ms": round((time.perf_counter() - started) * 1000, 1),
+        "within_budget": not target_bytes or len(data) <= target_bytes,
+    }
+    if output_format == "png" and not info["within_budget"]:
+        info["hint"] = PNG_OVER_BUDGET_HINT
+    return data, info
+
+
+def merge_encode_info(infos):
+    """Totals over several encoded files (pages or long-image parts)."""
+    qualities = [info["quality"] for info in infos if info["quality"] is not None]
+    hints = [info["hint"] for info in infos if info.get("hint")]
+    return {
+        "format": infos[0]["format"] if infos else None,
+        "quality": min(qualities) if qualities else None,
+        "bytes": sum(info["bytes"] for info in infos),
+        "encode_ms": round(sum(info["encode_ms"] for info in infos), 1),
+        "within_budget": all(info["within_budget"] for info in infos),
+        **({"hint": hints[0]} if hints else {}),
+    }
+
+
+# 长图按水平条带渲染、逐条编码，峰值内存只与条带大小有关；
+# 超过 max_height 时拆成多张图（打包为 zip）
+LONG_IMAGE_BAND_HEIGHT = 1024
+LONG_IMAGE_MAX_HEIGHT = 30000
+# JPEG/WebP 无法按条带编码，每段都要整张画布（target_kb 还会反复编码），
+# 所以分段高度另有上限：1080 宽约 13 MB RGB
+LONG_IMAGE_LOSSY_MAX_HEIGHT = 4096
+LONG_IMAGE_MARGIN_LEFT = 50
+
+
+class PNGStreamWriter:
+    """Write an RGB PNG incrementally, one horizontal band at a time.
+
+    Each band is PNG-encoded by Pillow (so it keeps Pillow's adaptive row
+    filters), its filtered scanlines are pulled out of the IDAT data and fed
+    into one shared zlib stream. Bands after the first are rendered with one
+    extra leading row that is dropped here, so the first real row is filtered
+    against the true previous row.
+    """
+
+    def __init__(self, fp, width, height, compress_level=6):
+        self.fp = fp
+        self.width = width
+        self.height = height
+        self.stride = width * 3 + 1
+        self.rows_written = 0
+        self.bytes_written = 0
+        self.encode_seconds = 0.0
+        self._compressor = zlib.compressobj(compress_level)
+        fp.write(b"\x89PNG\r\n\x1a\n")
+        self.bytes_written = 8
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self.bytes_written += len(data) + 12
+        self.fp.write(struct.pack(">I", len(data)))
+        self.fp.write(kind)
+        self.fp.write(data)
+        self.fp.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)) & 0xFFFFFFFF))
+
+    @staticmethod
+    def _filtered_scanlines(band):
+        buf = io.BytesIO()
+        band.save(buf, format="PNG", compress_level=1)
+        data = buf.getvalue()
+        pos = 8
+        idat = []
+        while pos < len(data):
+            length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+            if kind == b"IDAT":
+                idat.append(data[pos + 8:pos + 8 + length])
+            pos += 12 + length
+        return zlib.decompress(b"".join(idat))
+
+    def write_band(self, band, skip_rows=0):
+        started = time.perf_counter()
+        scanlines = self._filtered_scanlines(band)[skip_rows * self.stride:]
+        self.rows_written += len(scanlines) // self.stride
+        compressed = self._compressor.compress(scanlines)
+        self.encode_seconds += time.perf_counter() - started
+        if compressed:
+            self._chunk(b"IDAT", compressed)
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError(f"PNG 行数不符：{self.rows_written}/{self.height}")
+        self._chunk(b"IDAT", self._compressor.flush())
+        self._chunk(b"IEND", b"")
+
+
+def long_image_layout(img, content_start, end_start, font, line_height, margin_left=LONG_IMAGE_MARGIN_LEFT, shadow_offset=2):
+    """Split the background into head/content/tail and pick text colors."""
+    width, height = img.size
+    head = img.crop((0, 0, width, content_start))
+    content = img.crop((0, content_start, width, end_start))
+    tail = img.crop((0, end_start, width, height))
+
+    bg_color = content.getpixel((min(10, content.width - 1), min(10, content.height - 1)))
+    text_color = (30, 30, 30) if sum(bg_color) > 382 else (240, 240, 240)
+    shadow_color = (
+        (bg_color[0] - 30, bg_color[1] - 30, bg_color[2] - 30)
+        if sum(bg_color) > 382
+        else (0, 0, 0)
+    )
+    return {
+        "width": width,
+        "head": head,
+        "content": content,
+        "tail": tail,
+        "text_color": text_color,
+        "shadow_color": shadow_color,
+        "font": font,
+        "line_height": line_height,
+        "margin_left": margin_left,
+        "shadow_offset": shadow_offset,
+    }
+
 
+def check_long_image_range(content_start, end_start, height):
+    if not (0 <= content_start < end_start <= height):
+        raise ValueError("content_start/end_start 范围非法")
+
+
+def long_image_line_height(content_start, end_start, line_height=None):
+    return max(line_height or end_start - content_start, 80)
+
+
+def prepare_long_image(bg_bytes, content_start, end_start, font_path=None, font_size=38, line_height=None):
+    """Decode the background and build the long image layout at full size."""
+    img = Image.open(io.BytesIO(bg_bytes))
+    check_long_image_range(content_start, end_start, img.height)
+    return long_image_layout(
+        img,
+        content_start,
+        end_start,
+        pick_font(font_path, font_size),
+        long_image_line_height(content_start, end_start, line_height),
+    )
+
+
+def long_image_text_width(layout):
+    # 左右各留 margin_left，再扣掉阴影偏移
+    return layout["width"] - 2 * layout["margin_left"] - layout["shadow_offset"]
+
+
+def long_image_height(layout, line_count):
+    return layout["head"].height + line_count * layout["line_height"] + layout["tail"].height
+
+
+def render_long_image_band(layout, lines, y0, y1):
+    """Render rows [y0, y1) of the long image: head, content tiled down to the tail, then the song lines."""
+    head, content, tail = layout["head"], layout["content"], layout["tail"]
+    line_height = layout["line_height"]
+    total_height = long_image_height(layout, len(lines))
+    tail_top = total_height - tail.height
+    band = Image.new("RGB", (layout["width"], y1 - y0))
+    if y0 < head.height:
+        band.paste(head, (0, -y0))
+    first_tile = max((y0 - head.height) // content.height, 0)
+    y = head.height + first_tile * content.height
+    while y < y1 and y < tail_top:
+        band.paste(content, (0, y - y0))
+        y += content.height
+    if y1 > tail_top:
+        band.paste(tail, (0, tail_top - y0))
+
+    draw = ImageDraw.Draw(band)
+    font = layout["font"]
+    # 阴影/字形可能超出行框，上下各多画一行，超出条带的部分会被裁掉
+    first_line = max((y0 - head.height) // line_height - 1, 0)
+    last_line = min((y1 - head.height) // line_height + 1, len(lines) - 1)
+    for index in range(first_line, last_line + 1):
+        line, _, text_h = lines[index]
+        text_y = head.height + index * line_height + (line_height - text_h) // 2 - y0
+        x, offset = layout["margin_left"], layout["shadow_offset"]
+        draw.text((x + offset, text_y + offset), line, font=font, fill=layout["shadow_color"])
+        draw.text((x, text_y), line, font=font, fill=layout["text_color"])
+    return band
+
+
+def write_long_image_png(fp, layout, lines, band_height=LONG_IMAGE_BAND_HEIGHT, compress_level=6):
+    total_height = long_image_height(layout, len(lines))
+    writer = PNGStreamWriter(fp, layout["width"], total_height, compress_level=compress_level)
+    for y0 in range(0, total_height, band_height):
+        y1 = min(y0 + band_height, total_height)
+        overlap = 1 if y0 > 0 else 0
+        writer.write_band(render_long_image_band(layout, lines, y0 - overlap, y1), skip_rows=overlap)
+    writer.close()
+    return {
+        "format": "png",
+        "quality": None,
+        "bytes": writer.bytes_written,
+        "encode_ms": round(writer.encode_seconds * 1000, 1),
+    }
 
-def measure_text(draw_obj, text, font):
-    """Measure text size; compatible with Pillow versions where textsize is removed."""
-    if hasattr(draw_obj, "textbbox"):
-        bbox = draw_obj.textbbox((0, 0), text, font=font)
-        return bbox[2] - bbox[0], bbox[3] - bbox[1]
-    if hasattr(draw_obj, "textsize"):
-        return draw_obj.textsize(text, font=font)
-    # Fallback to font.getsize
-    return font.getsize(text)
+
+def write_long_image(fp, layout, lines, output_format="png", compress_level=6, target_bytes=None, band_height=LONG_IMAGE_BAND_HEIGHT):
+    """Write one long image part; PNG is streamed band by band, other formats need the whole canvas.
+
+    Callers keep lossy parts within LONG_IMAGE_LOSSY_MAX_HEIGHT.
+    """
+    if output_format == "png":
+        # 流式写入无法事后重编码：有目标大小时直接用最高压缩级别
+        if target_bytes:
+            compress_level = 9
+        info = write_long_image_png(fp, layout, lines, band_height=band_height, compress_level=compress_level)
+        info["within_budget"] = not target_bytes or info["bytes"] <= target_bytes
+        if not info["within_budget"]:
+            info["hint"] = PNG_OVER_BUDGET_HINT
+        return info
+    canvas = render_long_image_band(layout, lines, 0, long_image_height(layout, len(lines)))
+    data, info = encode_image(canvas, output_format, compress_level=compress_level, target_bytes=target_bytes)
+    fp.write(data)
+    return info
 
 
 def generate_playlist_image_from_bg(
@@ -311,123 +1187,840 @@ def generate_playlist_image_from_bg(
     names,
     font_path=None,
     font_size=38,
-    max_chars_per_line=35,
+    max_chars_per_line=None,
     max_songs_per_line=6,
     line_height=None,
     output_dir="static/uploads",
+    tag=None,
+    max_height=LONG_IMAGE_MAX_HEIGHT,
+    band_height=LONG_IMAGE_BAND_HEIGHT,
+    output_format="png",
+    compress_level=6,
+    target_kb=None,
 ):
+    """Render the long image; returns the web path plus encode stats (format, bytes, encode_ms, ...)."""
     if not names:
         raise ValueError("歌曲列表为空")
     ensure_upload_dir()
-    img = Image.open(io.BytesIO(bg_bytes))
-    width, height = img.size
-    if not (0 <= content_start < end_start <= height):
-        raise ValueError("content_start/end_start 范围非法")
-
-    head = img.crop((0, 0, width, content_start))
-    content = img.crop((0, content_start, width, end_start))
-    tail = img.crop((0, end_start, width, height))
-
-    bg_color = content.getpixel((min(10, content.width - 1), min(10, content.height - 1)))
-    text_color = (30, 30, 30) if sum(bg_color) > 382 else (240, 240, 240)
-
-    lines = wrap_song_names(
+    layout = prepare_long_image(
+        bg_bytes, content_start, end_start, font_path=font_path, font_size=font_size, line_height=line_height
+    )
+    lines = layout_song_lines(
         names,
-        max_chars_per_line=max_chars_per_line,
+        layout["font"],
+        long_image_text_width(layout),
         max_songs_per_line=max_songs_per_line,
+        max_chars_per_line=max_chars_per_line,
     )
-    resolved_line_height = max(line_height or content.height, 80)
-    total_height = head.height + len(lines) * resolved_line_height + tail.height
-    canvas = combine_background_img(head, content, tail, total_height)
-
-    font = pick_font(font_path, font_size)
-    draw = ImageDraw.Draw(canvas)
+    # JPEG/WebP 有最大边长限制，且整段在内存中编码，超出时同样拆分
+    format_limit = OUTPUT_FORMATS[output_format]["max_side"]
+    if output_format != "png":
+        format_limit = min(format_limit, LONG_IMAGE_LOSSY_MAX_HEIGHT)
+    max_height = min(max_height or format_limit, format_limit)
+    lines_per_part = len(lines)
+    if long_image_height(layout, len(lines)) > max_height:
+        fixed_height = long_image_height(layout, 0)
+        lines_per_part = max((max_height - fixed_height) // layout["line_height"], 1)
+    parts = [lines[i:i + lines_per_part] for i in range(0, len(lines), lines_per_part)]
+
+    if tag is None:
+        tag = render_cache_key(
+            "playlist_image",
+            bg_bytes,
+            names,
+            {
+                "content_start": content_start,
+                "end_start": end_start,
+                "font_path": font_path,
+                "font_size": font_size,
+                "max_chars_per_line": max_chars_per_line,
+                "max_songs_per_line": max_songs_per_line,
+                "line_height": line_height,
+                "max_height": max_height,
+                "output_format": output_format,
+                "compress_level": compress_level,
+                "target_kb": target_kb,
+            },
+        )
+    name = f"playlist_{tag}"
+    ext = OUTPUT_FORMATS[output_format]["ext"]
+    encode = functools.partial(
+        write_long_image,
+        layout=layout,
+        output_format=output_format,
+        compress_level=compress_level,
+        target_bytes=target_kb * 1024 if target_kb else None,
+        band_height=band_height,
+    )
+    if len(parts) == 1:
+        filename = f"{name}.{ext}"
+        with atomic_output(os.path.join(output_dir, filename)) as f:
+            info = encode(f, lines=lines)
+        return {"path": f"/static/uploads/{filename}", **info}
+
+    # 超高时拆分：每段都带完整头尾，直接流式写入 zip（图片已压缩，用 STORED）
+    filename = f"{name}.zip"
+    infos = []
+    with atomic_output(os.path.join(output_dir, filename)) as out:
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as zf:
+            for index, part_lines in enumerate(parts):
+                with zf.open(f"{name}_part{index + 1:02d}.{ext}", "w", force_zip64=True) as f:
+                    infos.append(encode(f, lines=part_lines))
+    return {"path": f"/static/uploads/{filename}", **merge_encode_info(infos)}
+
+
+def page_text_colors(img, x1, y1):
+    """Text and shadow colors picked from the background just inside the rect."""
+    sample_x = min(max(x1 + 5, 0), img.width - 1)
+    sample_y = min(max(y1 + 5, 0), img.height - 1)
+    bg_color = img.getpixel((sample_x, sample_y))
+    text_color = (30, 30, 30) if sum(bg_color) > 382 else (240, 240, 240)
     shadow_color = (
-        (bg_color[0] - 30, bg_color[1] - 30, bg_color[2] - 30)
+        (max(bg_color[0] - 30, 0), max(bg_color[1] - 30, 0), max(bg_color[2] - 30, 0))
         if sum(bg_color) > 382
         else (0, 0, 0)
     )
+    return text_color, shadow_color
 
-    y = head.height
-    margin_left = 50
-    for line in lines:
-        text_w, text_h = measure_text(draw, line, font)
-        text_y = y + (resolved_line_height - text_h) // 2
-        draw.text((margin_left + 2, text_y + 2), line, font=font, fill=shadow_color)
-        draw.text((margin_left, text_y), line, font=font, fill=text_color)
-        y += resolved_line_height
-
-    ts = int(time.time())
-    filename = f"playlist_{ts}.png"
-    path_fs = os.path.join(output_dir, filename)
-    canvas.save(path_fs, quality=95)
-    return f"/static/uploads/{filename}"
 
-
-def generate_playlist_pages_from_bg(
+def plan_playlist_pages(
     bg_bytes,
     rect,
     names,
-    font_path=None,
-    font_size=38,
-    max_chars_per_line=35,
+    max_chars_per_line=None,
     max_songs_per_line=6,
     line_height=80,
-    output_dir="static/uploads",
+    font_path=None,
+    font_size=38,
 ):
+    """Lay song names out to the rect width, split them into pages and pick text colors."""
     if not names:
         raise ValueError("歌曲列表为空")
-    ensure_upload_dir()
     img = Image.open(io.BytesIO(bg_bytes)).convert("RGB")
     width, height = img.size
     x1, y1, x2, y2 = rect
     if not (0 <= x1 < x2 <= width and 0 <= y1 < y2 <= height):
         raise ValueError("矩形范围非法")
 
-    lines = wrap_song_names(names, max_chars_per_line=max_chars_per_line, max_songs_per_line=max_songs_per_line)
+    lines = layout_song_lines(
+        names,
+        pick_font(font_path, font_size),
+        x2 - x1 - 2,
+        max_songs_per_line=max_songs_per_line,
+        max_chars_per_line=max_chars_per_line,
+    )
     lines_per_page = max(1, (y2 - y1) // line_height)
     pages = math.ceil(len(lines) / lines_per_page)
 
-    sample_x = min(max(x1 + 5, 0), width - 1)
-    sample_y = min(max(y1 + 5, 0), height - 1)
-    bg_color = img.getpixel((sample_x, sample_y))
-    text_color = (30, 30, 30) if sum(bg_color) > 382 else (240, 240, 240)
-    shadow_color = (
-        (max(bg_color[0] - 30, 0), max(bg_color[1] - 30, 0), max(bg_color[2] - 30, 0))
-        if sum(bg_color) > 382
-        else (0, 0, 0)
-    )
-    font = pick_font(font_path, font_size)
+    text_color, shadow_color = page_text_colors(img, x1, y1)
+    return {
+        "pages": [lines[page * lines_per_page:(page + 1) * lines_per_page] for page in range(pages)],
+        "text_color": text_color,
+        "shadow_color": shadow_color,
+    }
+
+
+def draw_page_lines(canvas, rect, page_lines, text_color, shadow_color, font, line_height, shadow_offset=2):
+    x1, y1, _, _ = rect
+    draw = ImageDraw.Draw(canvas)
+    y = y1
+    for line, _, text_h in page_lines:
+        text_y = y + (line_height - text_h) // 2
+        draw.text((x1 + shadow_offset, text_y + shadow_offset), line, font=font, fill=shadow_color)
+        draw.text((x1, text_y), line, font=font, fill=text_color)
+        y += line_height
+
+
+def render_playlist_page(
+    bg_bytes,
+    rect,
+    page_lines,
+    text_color,
+    shadow_color,
+    font_path=None,
+    font_size=38,
+    line_height=80,
+    output_format="png",
+    compress_level=6,
+    target_bytes=None,
+):
+    """Draw one page of lines onto the background; returns ``(data, encode_info)``."""
+    canvas = Image.open(io.BytesIO(bg_bytes)).convert("RGB")
+    draw_page_lines(canvas, rect, page_lines, text_color, shadow_color, pick_font(font_path, font_size), line_height)
+    return encode_image(canvas, output_format, compress_level=compress_level, target_bytes=target_bytes)
+
+
+def playlist_page_name(tag, index, output_format="png"):
+    return f"playlist_page_{tag}_{index + 1:02d}.{OUTPUT_FORMATS[output_format]['ext']}"
+
+
+def playlist_zip_entry(arcname):
+    """Zip entry for an already-compressed PNG: stored, not deflated again."""
+    info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    return info
+
+
+class ZipStreamBuffer:
+    """Unseekable file object for ZipFile; written bytes are collected until drained.
+
+    ZipFile falls back to data descriptors on unseekable output, so the archive
+    can be sent to the client entry by entry without a temporary file.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer.extend(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+# 参数调试用的快速预览：背景按 token 解码并缩小后缓存，调参时只重画文字层
+PREVIEW_WIDTH = 540
+PREVIEW_LINES = 12
+
+
+class PreviewBackgroundExpired(ValueError):
+    pass
+
+
+class PreviewBackgrounds:
+    """LRU of decoded, downscaled preview backgrounds keyed by a content token."""
+
+    def __init__(self, max_entries=8, width=PREVIEW_WIDTH):
+        self.max_entries = max_entries
+        self.width = width
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
 
-    ts = int(time.time())
-    saved_files = []
-    for page in range(pages):
-        start = page * lines_per_page
-        end = start + lines_per_page
-        page_lines = lines[start:end]
+    def put(self, bg_bytes):
+        token = hashlib.sha256(bg_bytes).hexdigest()[:16]
+        with self._lock:
+            if token in self._entries:
+                self._entries.move_to_end(token)
+                return token
+        img = Image.open(io.BytesIO(bg_bytes))
+        size = img.size
+        # thumbnail 对 JPEG 会走 draft 解码，只解出接近目标尺寸的数据
+        img.thumbnail((self.width, size[1]))
+        entry = {"image": img.convert("RGB"), "size": size, "scale": img.width / size[0]}
+        with self._lock:
+            self._entries[token] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return token
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token or "")
+            if entry is None:
+                self.misses += 1
+                raise PreviewBackgroundExpired("预览背景已过期，请重新上传")
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry
+
+    def stats(self):
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+def rescale_lines(lines, font):
+    """Re-measure laid out lines with another font (same breaks, preview-sized metrics)."""
+    metrics = font_metrics(font)
+    return [(text, metrics.width(text), metrics.height(text)) for text, _, _ in lines]
+
+
+def render_preview(entry, kind, names, options, fmt="jpeg", max_lines=PREVIEW_LINES):
+    """Render a downscaled preview: the first page, or head + first lines + tail of the long image.
+
+    Line breaks are computed at full size so they match the real render; only
+    drawing happens at preview scale.
+    """
+    if not names:
+        raise ValueError("歌曲列表为空")
+    img, scale = entry["image"], entry["scale"]
+    width, height = entry["size"]
+    full_font = pick_font(options["font_path"], options["font_size"])
+    font = pick_font(options["font_path"], max(round(options["font_size"] * scale), 1))
+    shadow_offset = max(round(2 * scale), 1)
+    if kind == "playlist_image":
+        content_start, end_start = options["content_start"], options["end_start"]
+        check_long_image_range(content_start, end_start, height)
+        line_height = long_image_line_height(content_start, end_start, options["line_height"])
+        lines = layout_song_lines(
+            names,
+            full_font,
+            width - 2 * LONG_IMAGE_MARGIN_LEFT - 2,
+            max_songs_per_line=options["max_songs_per_line"],
+            max_chars_per_line=options["max_chars_per_line"],
+            max_lines=max_lines,
+        )
+        scaled_start = min(round(content_start * scale), img.height - 1)
+        scaled_end = min(max(round(end_start * scale), scaled_start + 1), img.height)
+        layout = long_image_layout(
+            img,
+            scaled_start,
+            scaled_end,
+            font,
+            max(round(line_height * scale), 1),
+            margin_left=round(LONG_IMAGE_MARGIN_LEFT * scale),
+            shadow_offset=shadow_offset,
+        )
+        lines = rescale_lines(lines, font)
+        canvas = render_long_image_band(layout, lines, 0, long_image_height(layout, len(lines)))
+    else:
+        x1, y1, x2, y2 = options["rect"]
+        if not (0 <= x1 < x2 <= width and 0 <= y1 < y2 <= height):
+            raise ValueError("矩形范围非法")
+        line_height = options["line_height"]
+        lines = layout_song_lines(
+            names,
+            full_font,
+            x2 - x1 - 2,
+            max_songs_per_line=options["max_songs_per_line"],
+            max_chars_per_line=options["max_chars_per_line"],
+            max_lines=max(1, (y2 - y1) // line_height),
+        )
+        rect = tuple(round(v * scale) for v in (x1, y1, x2, y2))
         canvas = img.copy()
-        draw = ImageDraw.Draw(canvas)
-        y = y1
-        for line in page_lines:
-            text_w, text_h = measure_text(draw, line, font)
-            text_y = y + (line_height - text_h) // 2
-            draw.text((x1 + 2, text_y + 2), line, font=font, fill=shadow_color)
-            draw.text((x1, text_y), line, font=font, fill=text_color)
-            y += line_height
-        filename = f"playlist_page_{ts}_{page+1:02d}.png"
-        path_fs = os.path.join(output_dir, filename)
-        canvas.save(path_fs, quality=95)
-        saved_files.append(path_fs)
-
-    zip_name = f"playlist_pages_{ts}.zip"
-    zip_path = os.path.join(output_dir, zip_name)
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-        for fpath in saved_files:
-            zf.write(fpath, arcname=os.path.basename(fpath))
-    return {
-        "zip_path": f"/static/uploads/{zip_name}",
-        "files": [f"/static/uploads/{os.path.basename(p)}" for p in saved_files],
+        text_color, shadow_color = page_text_colors(canvas, rect[0], rect[1])
+        draw_page_lines(
+            canvas,
+            rect,
+            rescale_lines(lines, font),
+            text_color,
+            shadow_color,
+            font,
+            max(round(line_height * scale), 1),
+            shadow_offset=shadow_offset,
+        )
+    buf = io.BytesIO()
+    if fmt == "webp":
+        canvas.save(buf, format="WEBP", quality=75, method=0)
+    else:
+        canvas.save(buf, format="JPEG", quality=80)
+    return buf.getvalue()
+
+
+class RenderBusyError(Exception):
+    pass
+
+
+class RenderPool:
+    """Run playlist renderers in a worker pool with admission control.
+
+    At most ``workers`` renders run at once and at most ``max_queue`` more may
+    wait; anything beyond that is rejected with RenderBusyError instead of
+    piling up behind a long render.
+    """
+
+    def __init__(self, executor="process", workers=2, max_queue=4, preload_font_sizes=()):
+        self.kind = executor
+        self.workers = max(int(workers), 1)
+        self.max_queue = max(int(max_queue), 0)
+        self.preload_font_sizes = tuple(preload_font_sizes)
+        if executor == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+        else:
+            # spawn：不继承事件循环线程 / sqlite 连接等父进程状态
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=preload_fonts if self.preload_font_sizes else None,
+                initargs=(self.preload_font_sizes,),
+            )
+        self._slots = asyncio.Semaphore(self.workers)
+        self.running = 0
+        self.pending = 0
+        self.rejected = 0
+
+    async def warm_up(self):
+        """Start the workers and load fonts ahead of the first render; renders are accepted meanwhile."""
+        if not self.preload_font_sizes:
+            return
+        try:
+            await asyncio.gather(
+                *[self.call(preload_fonts, self.preload_font_sizes) for _ in range(self.workers)]
+            )
+        except Exception:
+            # 预热只是提前加载字体，失败时首次渲染再加载即可
+            logger.warning("渲染进程预热失败", exc_info=True)
+
+    def admit(self):
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise RenderBusyError("渲染任务繁忙，请稍后再试")
+
+    def reserve(self):
+        """Admit a job now and count it as pending; the job later enters ``slot(reserved=True)``."""
+        self.admit()
+        self.pending += 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, admit=True, reserved=False):
+        """Hold one render slot; wait in the queue if all slots are busy.
+
+        ``admit=False`` skips the admission check, for work that was already
+        admitted and only re-takes its slot (e.g. the next page of a stream);
+        ``reserved=True`` takes over the place counted by reserve().
+        """
+        if not reserved:
+            if admit:
+                self.admit()
+            self.pending += 1
+        try:
+            async with self._slots:
+                self.running += 1
+                try:
+                    yield
+                finally:
+                    self.running -= 1
+        finally:
+            self.pending -= 1
+
+    def has_free_slot(self):
+        """True when a slot is free and no render is queued for one."""
+        return not self._slots.locked()
+
+    async def call(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def run(self, func, *args, **kwargs):
+        async with self.slot():
+            return await self.call(func, *args, **kwargs)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "queued": self.pending - self.running,
+            "rejected": self.rejected,
+        }
+
+
+async def render_pool_ctx(app):
+    options = app["config"].render_options()
+    app["render_pool"] = RenderPool(
+        options["executor"], options["workers"], options["max_queue"], options["preload_font_sizes"]
+    )
+    app["render_jobs"] = RenderJobs(options["jobs_dir"], ttl=options["job_ttl"])
+    app["render_tasks"] = set()
+    app["render_inflight"] = {}
+    app["preview_backgrounds"] = PreviewBackgrounds()
+
+    async def cleanup_loop():
+        while True:
+            await asyncio.to_thread(app["render_jobs"].cleanup)
+            await asyncio.sleep(300)
+
+    cleanup_task = asyncio.ensure_future(cleanup_loop())
+    warm_up_task = asyncio.ensure_future(app["render_pool"].warm_up())
+    yield
+    warm_up_task.cancel()
+    cleanup_task.cancel()
+    for task in list(app["render_tasks"]):
+        task.cancel()
+    app["render_pool"].shutdown()
+
+
+JOB_ACTIVE_STATUSES = ("queued", "running")
+
+
+def pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class RenderJobs:
+    """Render job records kept in memory and mirrored to ``jobs_dir/<id>.json``.
+
+    Records outlive the browser session (the admin page re-reads them on load);
+    jobs older than ``ttl`` seconds are removed together with their artifacts.
+    """
+
+    def __init__(self, jobs_dir, ttl=86400):
+        self.jobs_dir = jobs_dir
+        self.ttl = ttl
+        self._jobs = {}
+        os.makedirs(jobs_dir, exist_ok=True)
+        self._fail_orphans()
+
+    def _fail_orphans(self):
+        """Mark jobs whose owning process is gone (e.g. after a restart) as failed."""
+        for job in self.recent(limit=None):
+            # 本进程刚启动，内存里还没有任务；同 pid 的记录只可能来自上一次运行（如容器内 pid 1）
+            pid = job.get("pid")
+            if job["status"] in JOB_ACTIVE_STATUSES and (pid == os.getpid() or not pid_alive(pid)):
+                job.update(status="failed", error="服务重启，任务已中断", updated_at=time.time())
+                self._save(job)
+
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _save(self, job):
+        path = self._path(job["id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def create(self, kind, cache_key=None):
+        now = time.time()
+        job = {
+            "id": secrets.token_hex(8),
+            "kind": kind,
+            "cache_key": cache_key,
+            "cached": False,
+            "status": "queued",
+            "pid": os.getpid(),
+            "progress": {"done": 0, "total": 1},
+            "created_at": now,
+            "updated_at": now,
+            "result": None,
+            "artifacts": [],
+            "error": None,
+        }
+        self._jobs[job["id"]] = job
+        self._save(job)
+        return job
+
+    def update(self, job_id, **fields):
+        job = self._jobs[job_id]
+        job.update(fields, updated_at=time.time())
+        self._save(job)
+        return job
+
+    def get(self, job_id):
+        if not re.fullmatch(r"[0-9a-f]{16}", job_id or ""):
+            return None
+        job = self._jobs.get(job_id)
+        if job is None:
+            try:
+                with open(self._path(job_id), "r", encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                return None
+        return job
+
+    def recent(self, limit=20):
+        jobs = {}
+        for filename in os.listdir(self.jobs_dir):
+            if filename.endswith(".json"):
+                job = self.get(filename[:-5])
+                if job:
+                    jobs[job["id"]] = job
+        jobs.update(self._jobs)
+        return sorted(jobs.values(), key=lambda j: j["created_at"], reverse=True)[:limit]
+
+    def cleanup(self):
+        cutoff = time.time() - self.ttl
+        jobs = self.recent(limit=None)
+        expired = [
+            job for job in jobs if job["updated_at"] < cutoff and job["status"] not in JOB_ACTIVE_STATUSES
+        ]
+        expired_ids = {job["id"] for job in expired}
+        # 相同内容的任务共用同一份文件，仍有未过期任务引用时保留
+        kept_artifacts = {
+            path for job in jobs if job["id"] not in expired_ids for path in job.get("artifacts") or []
+        }
+        for job in expired:
+            for path in job.get("artifacts") or []:
+                if path in kept_artifacts:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            try:
+                os.remove(self._path(job["id"]))
+            except OSError:
+                pass
+            self._jobs.pop(job["id"], None)
+
+
+def public_job(job):
+    """Job fields returned to the admin page (without filesystem paths)."""
+    data = {k: v for k, v in job.items() if k not in ("artifacts", "pid")}
+    if job["status"] == "done" and job.get("artifacts"):
+        data["download_url"] = f"/admin/jobs/{job['id']}/download"
+    return data
+
+
+# 渲染结果按内容寻址：背景、参数、字体文件与歌名列表相同则复用已生成的文件；
+# 渲染逻辑变化导致输出不同时递增版本号
+RENDER_CACHE_VERSION = 1
+
+
+def render_cache_key(kind, bg_bytes, names, options):
+    """Hash of everything that determines a render's output; used as the artifact name."""
+    font_path = resolve_font_path(options.get("font_path"), options.get("font_size") or 38)
+    font_id = [font_path]
+    if font_path:
+        with contextlib.suppress(OSError):
+            stat = os.stat(font_path)
+            font_id += [stat.st_size, stat.st_mtime_ns]
+    payload = {
+        "version": RENDER_CACHE_VERSION,
+        "kind": kind,
+        "options": options,
+        "font": font_id,
+        "bg": hashlib.sha256(bg_bytes).hexdigest(),
+        "names": hashlib.sha256("\n".join(names).encode("utf-8")).hexdigest(),
     }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:32]
+
+
+def cached_render_result(kind, key, upload_dir=os.path.join("static", "uploads")):
+    """Return (result, artifacts) for an already rendered key, or None."""
+    if kind == "playlist_image":
+        for ext in ("png", "jpg", "webp", "zip"):
+            path_fs = os.path.join(upload_dir, f"playlist_{key}.{ext}")
+            if os.path.exists(path_fs):
+                result = {"path": "/" + path_fs.replace(os.sep, "/"), "bytes": os.path.getsize(path_fs)}
+                return result, [path_fs]
+        return None
+    zip_fs = os.path.join(upload_dir, f"playlist_pages_{key}.zip")
+    if not os.path.exists(zip_fs):
+        return None
+    prefix = f"playlist_page_{key}_"
+    files = sorted(
+        os.path.join(upload_dir, filename)
+        for filename in os.listdir(upload_dir)
+        if filename.startswith(prefix) and not filename.endswith(".tmp")
+    )
+    result = {
+        "zip_path": "/" + zip_fs.replace(os.sep, "/"),
+        "files": ["/" + p.replace(os.sep, "/") for p in files],
+        "bytes": os.path.getsize(zip_fs),
+    }
+    return result, [zip_fs] + files
+
+
+async def run_render_job(app, job_id, kind, bg_bytes, names, options, key):
+    jobs = app["render_jobs"]
+    pool = app["render_pool"]
+    try:
+        # submit_render_job 已经 reserve() 过，这里不再重复准入
+        async with pool.slot(reserved=True):
+            jobs.update(job_id, status="running")
+            if kind == "playlist_pages":
+                plan = await plan_pages_job(pool, bg_bytes, names, options)
+            else:
+                result = await pool.call(
+                    generate_playlist_image_from_bg,
+                    bg_bytes,
+                    options.pop("content_start"),
+                    options.pop("end_start"),
+                    names,
+                    tag=key,
+                    **options,
+                )
+                jobs.update(
+                    job_id,
+                    progress={"done": 1, "total": 1},
+                    result=result,
+                    artifacts=[result["path"].lstrip("/")],
+                )
+        if kind == "playlist_pages":
+            # 分页渲染每页各占一个名额，由 iter_rendered_pages 申请
+            await run_pages_job(app, job_id, bg_bytes, plan, options, key)
+        jobs.update(job_id, status="done")
+    except asyncio.CancelledError:
+        jobs.update(job_id, status="failed", error="服务已停止，任务被取消")
+        raise
+    except Exception as exc:
+        jobs.update(job_id, status="failed", error=str(exc))
+    finally:
+        app["render_inflight"].pop(key, None)
+
+
+async def iter_rendered_pages(pool, bg_bytes, plan, options):
+    """Render pages across the pool's workers and yield (index, data, encode_info) in page order.
+
+    Every page in flight holds its own render slot (admitted already, so
+    ``slot(admit=False)``). One page is always in flight, waiting in the queue
+    if needed; more run in parallel only while slots are free and nothing else
+    is queued, up to ``pool.workers``. The caller holds no slot while it
+    consumes pages.
+    """
+    pages = plan["pages"]
+
+    async def render(index):
+        async with pool.slot(admit=False):
+            return await pool.call(
+                render_playlist_page,
+                bg_bytes,
+                options["rect"],
+                pages[index],
+                plan["text_color"],
+                plan["shadow_color"],
+                font_path=options["font_path"],
+                font_size=options["font_size"],
+                line_height=options["line_height"],
+                output_format=options["output_format"],
+                compress_level=options["compress_level"],
+                target_bytes=options["target_kb"] * 1024 if options["target_kb"] else None,
+            )
+
+    window = deque()
+    next_index = 0
+
+    async def fill():
+        nonlocal next_index
+        while next_index < len(pages) and len(window) < pool.workers and (not window or pool.has_free_slot()):
+            window.append(asyncio.ensure_future(render(next_index)))
+            next_index += 1
+            # 让新任务先拿到名额，再判断是否还有空闲名额
+            await asyncio.sleep(0)
+
+    try:
+        for index in range(len(pages)):
+            await fill()
+            data, info = await window.popleft()
+            yield index, data, info
+    finally:
+        for task in window:
+            task.cancel()
+
+
+async def plan_pages_job(pool, bg_bytes, names, options):
+    return await pool.call(
+        plan_playlist_pages,
+        bg_bytes,
+        options["rect"],
+        names,
+        max_chars_per_line=options["max_chars_per_line"],
+        max_songs_per_line=options["max_songs_per_line"],
+        line_height=options["line_height"],
+        font_path=options["font_path"],
+        font_size=options["font_size"],
+    )
+
+
+async def run_pages_job(app, job_id, bg_bytes, plan, options, key):
+    jobs = app["render_jobs"]
+    pool = app["render_pool"]
+    ensure_upload_dir()
+    total = len(plan["pages"])
+    upload_dir = os.path.join("static", "uploads")
+    zip_fs = os.path.join(upload_dir, f"playlist_pages_{key}.zip")
+    persisted = []
+    infos = []
+    output_format = options["output_format"]
+    jobs.update(job_id, progress={"done": 0, "total": total}, artifacts=[zip_fs])
+    # 每页只编码一次：直接以 STORED 写入 zip；需要单页文件时再另存
+    with atomic_output(zip_fs) as out, zipfile.ZipFile(out, "w") as zf:
+        async for index, data, info in iter_rendered_pages(pool, bg_bytes, plan, options):
+            infos.append(info)
+            arcname = playlist_page_name(key, index, output_format)
+            await asyncio.to_thread(zf.writestr, playlist_zip_entry(arcname), data)
+            if options.get("persist_pages"):
+                path_fs = os.path.join(upload_dir, arcname)
+                await asyncio.to_thread(write_bytes, path_fs, data)
+                persisted.append(path_fs)
+                jobs.update(job_id, artifacts=[zip_fs] + persisted)
+            jobs.update(job_id, progress={"done": index + 1, "total": total})
+    jobs.update(
+        job_id,
+        result={
+            "zip_path": "/" + zip_fs.replace(os.sep, "/"),
+            "files": ["/" + p.replace(os.sep, "/") for p in persisted],
+            **merge_encode_info(infos),
+        },
+    )
+
+
+async def stream_playlist_pages(request, bg_bytes, names, options):
+    """Send the pages zip: a cached artifact if one exists, else render and stream it chunked without writing to disk."""
+    key = render_cache_key("playlist_pages", bg_bytes, names, options)
+    filename = f"playlist_pages_{key}.zip"
+    cached = cached_render_result("playlist_pages", key)
+    if cached is not None:
+        headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+        return web.FileResponse(path=cached[1][0], headers=headers)
+    pool = request.app["render_pool"]
+    # 准入并规划分页时占一个名额；之后每页渲染各自占名额，向慢速客户端写数据时不占用
+    async with pool.slot():
+        plan = await plan_pages_job(pool, bg_bytes, names, options)
+    pages = iter_rendered_pages(pool, bg_bytes, plan, options)
+    try:
+        response = web.StreamResponse(
+            headers={
+                "Content-Type": "application/zip",
+                "Content-Disposition": f'attachment; filename="{filename}"',
+                "Cache-Control": "no-store",
+            }
+        )
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        buffer = ZipStreamBuffer()
+        with zipfile.ZipFile(buffer, "w") as zf:
+            output_format = options["output_format"]
+            async for index, data, _ in pages:
+                zf.writestr(playlist_zip_entry(playlist_page_name(key, index, output_format)), data)
+                await response.write(buffer.drain())
+        await response.write(buffer.drain())
+        await response.write_eof()
+        return response
+    finally:
+        await pages.aclose()
+
+
+def submit_render_job(app, kind, bg_bytes, names, options):
+    """Register a job and start it in the background; raises RenderBusyError when full.
+
+    Identical requests reuse the finished artifact (the job is done at once) or
+    the job already rendering it.
+    """
+    jobs = app["render_jobs"]
+    key = render_cache_key(kind, bg_bytes, names, options)
+    cached = cached_render_result(kind, key)
+    if cached is not None:
+        result, artifacts = cached
+        job = jobs.create(kind, cache_key=key)
+        return jobs.update(
+            job["id"],
+            status="done",
+            cached=True,
+            progress={"done": 1, "total": 1},
+            result=result,
+            artifacts=artifacts,
+        )
+    inflight = jobs.get(app["render_inflight"].get(key))
+    if inflight is not None and inflight["status"] in JOB_ACTIVE_STATUSES:
+        return inflight
+    app["render_pool"].reserve()
+    job = jobs.create(kind, cache_key=key)
+    app["render_inflight"][key] = job["id"]
+    task = asyncio.ensure_future(run_render_job(app, job["id"], kind, bg_bytes, names, options, key))
+    app["render_tasks"].add(task)
+    task.add_done_callback(app["render_tasks"].discard)
+    return job
 
 
 def wants_json(request):
@@ -438,29 +2031,123 @@ def wants_json(request):
 async def fetch_songs(conn):
     """获取歌曲列表，按 id 升序。"""
     cursor = await conn.execute(
-        "SELECT id, name, artist, language, genre, url FROM songs ORDER BY id ASC"
+        "SELECT id, name, artist, language, genre, url FROM songs ORDER BY id ASC"
+    )
+    rows = await cursor.fetchall()
+    await cursor.close()
+    return [dict(row) for row in rows]
+
+
+def compute_sort_key(name, language):
+    """排序键（中文优先、短优先、拼音/字母），写入时计算并存入 songs 表。"""
+    language_priority = 0 if language == "中文" else 1
+    word_count = len(name)
+    if language == "中文":
+        name_for_sort = "".join([item[0] for item in pinyin(name, style=Style.NORMAL)])
+    else:
+        name_for_sort = name.lower()
+    return (language_priority, word_count, name_for_sort)
+
+
+async def fetch_songs_sorted(conn):
+    """获取歌曲列表，按预计算的排序键排序（中文优先、短优先、拼音/字母）。"""
+    cursor = await conn.execute(
+        """
+        SELECT id, name, artist, language, genre, url FROM songs
+        ORDER BY sort_priority, sort_length, sort_name, id
+        """
     )
     rows = await cursor.fetchall()
     await cursor.close()
     return [dict(row) for row in rows]
 
 
-async def fetch_songs_sorted(conn):
-    """获取歌曲列表，按原先规则排序（中文优先、短优先、拼音/字母）。"""
-    songs = await fetch_songs(conn)
-
-    def sort_key(song):
-        name = song["name"]
-        language = song["language"]
-        language_priority = 0 if language == "中文" else 1
-        word_count = len(name)
-        if language == "中文":
-            name_for_sort = "".join([item[0] for item in pinyin(name, style=Style.NORMAL)])
-        else:
-            name_for_sort = name.lower()
-        return (language_priority, word_count, name_for_sort)
+# 中日韩字符逐字切分，使 unicode61 分词器能按单字/短语匹配中文歌名
+_CJK_CHAR_RE = re.compile(r"([\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af\uf900-\ufaff])")
+_SEARCH_WORD_RE = re.compile(r"[^\W_]+")
+SEARCH_INSERT_SQL = """
+    INSERT INTO songs_fts (rowid, name, artist, genre, language, name_pinyin, name_initials)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+SEARCH_PAGE_SIZE = 20
+SEARCH_PAGE_SIZE_MAX = 100
+
+
+def segment_for_search(text):
+    return " ".join(_CJK_CHAR_RE.sub(r" \1 ", (text or "").lower()).split())
+
+
+def pinyin_search_terms(name):
+    """返回 (全拼, 首字母)，如 青花瓷 -> ("qing hua ci qinghuaci", "qhc")。"""
+    words = []
+    for item in lazy_pinyin((name or "").lower(), style=Style.NORMAL):
+        words.extend(_SEARCH_WORD_RE.findall(item))
+    full = " ".join(words + ["".join(words)]) if words else ""
+    initials = "".join(word[0] for word in words)
+    return full, initials
+
+
+def song_search_row(song_id, name, artist, language, genre):
+    full, initials = pinyin_search_terms(name)
+    return (
+        song_id,
+        segment_for_search(name),
+        segment_for_search(artist),
+        segment_for_search(genre),
+        segment_for_search(language),
+        full,
+        initials,
+    )
 
-    return sorted(songs, key=sort_key)
+
+async def index_song_for_search(conn, song_id, name, artist, language, genre):
+    await conn.execute("DELETE FROM songs_fts WHERE rowid = ?", (song_id,))
+    await conn.execute(SEARCH_INSERT_SQL, song_search_row(song_id, name, artist, language, genre))
+
+
+def build_search_match(query):
+    """把用户输入转成 FTS5 MATCH 表达式：每个词一个前缀短语，词之间为 AND。"""
+    terms = []
+    for word in _SEARCH_WORD_RE.findall((query or "").lower()):
+        phrase = segment_for_search(word).replace('"', '""')
+        terms.append(f'"{phrase}"*')
+    return " ".join(terms)
+
+
+async def search_songs(conn, query, language=None, genre=None, page=1, page_size=SEARCH_PAGE_SIZE):
+    """Search songs by name/artist/genre/language, full pinyin or pinyin initials."""
+    match = build_search_match(query)
+    filters = []
+    params = []
+    if language:
+        filters.append("s.language = ?")
+        params.append(language)
+    if genre:
+        filters.append("s.genre = ?")
+        params.append(genre)
+    if match:
+        source = "songs_fts f JOIN songs s ON s.id = f.rowid"
+        filters.insert(0, "songs_fts MATCH ?")
+        params.insert(0, match)
+        # 歌名、首字母、全拼命中权重更高
+        order = "bm25(songs_fts, 10.0, 4.0, 1.0, 1.0, 6.0, 8.0), s.sort_priority, s.sort_length, s.sort_name, s.id"
+    else:
+        source = "songs s"
+        order = "s.sort_priority, s.sort_length, s.sort_name, s.id"
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+    cursor = await conn.execute(f"SELECT COUNT(*) AS total FROM {source} {where}", params)
+    total = (await cursor.fetchone())["total"]
+    await cursor.close()
+    cursor = await conn.execute(
+        f"""
+        SELECT s.id, s.name, s.artist, s.language, s.genre, s.url FROM {source} {where}
+        ORDER BY {order} LIMIT ? OFFSET ?
+        """,
+        [*params, page_size, (page - 1) * page_size],
+    )
+    rows = await cursor.fetchall()
+    await cursor.close()
+    return total, [dict(row) for row in rows]
 
 
 async def fetch_unique_languages(conn):
@@ -477,60 +2164,316 @@ async def fetch_unique_genres(conn):
     return [row["genre"] for row in rows]
 
 
-async def get_settings(conn):
-    await ensure_settings_table(conn)
+async def read_settings(conn):
+    """Site settings straight from the database, merged over DEFAULT_SETTINGS (no cache)."""
     cursor = await conn.execute("SELECT key, value FROM site_settings")
     rows = await cursor.fetchall()
     await cursor.close()
-    stored = {row["key"]: row["value"] for row in rows}
     merged = DEFAULT_SETTINGS.copy()
-    merged.update({k: v for k, v in stored.items() if v is not None})
+    merged.update({row["key"]: row["value"] for row in rows if row["value"] is not None})
     return merged
 
 
+async def get_settings(conn):
+    """Site settings merged over DEFAULT_SETTINGS, served from SETTINGS_CACHE after the first read."""
+    cached = SETTINGS_CACHE["settings"]
+    if cached is not None:
+        SETTINGS_CACHE["hits"] += 1
+        return dict(cached)
+    SETTINGS_CACHE["misses"] += 1
+    generation = SETTINGS_CACHE["generation"]
+    merged = await read_settings(conn)
+    if generation == SETTINGS_CACHE["generation"]:
+        SETTINGS_CACHE["settings"] = merged
+    return dict(merged)
+
+
 async def update_settings(conn, settings: dict):
-    await ensure_settings_table(conn)
-    for key, value in settings.items():
-        await conn.execute(
+    try:
+        await conn.executemany(
             "INSERT INTO site_settings (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
-            (key, value),
+            list(settings.items()),
         )
-    await conn.commit()
+        await bump_catalog_version(conn)
+        await conn.commit()
+    except BaseException:
+        await conn.rollback()
+        raise
+    finally:
+        invalidate_settings_cache()
 
 
-async def add_song(conn, name, artist, language, genre, url):
+def group_songs_by_language(songs, languages):
+    """按语言分组（保持 songs 的排序），供首页卡片布局逐组渲染。"""
+    groups = {lang: [] for lang in languages}
+    for song in songs:
+        groups.setdefault(song["language"], []).append(song)
+    return [(lang, groups[lang]) for lang in languages]
+
+
+async def build_catalog_snapshot(conn, version, updated_at):
+    songs = await fetch_songs_sorted(conn)
+    languages = await fetch_unique_languages(conn)
+    genres = await fetch_unique_genres(conn)
+    settings = await get_settings(conn)
+    return {
+        "version": version,
+        "updated_at": updated_at,
+        "built_at": time.time(),
+        "songs": songs,
+        "songs_by_language": group_songs_by_language(songs, languages),
+        "languages": languages,
+        "genres": genres,
+        "settings": settings,
+    }
+
+
+async def get_catalog_snapshot(conn):
+    """Return the cached catalog snapshot, rebuilding it only when the version moved."""
+    await refresh_catalog_version(conn)
+    snapshot = CATALOG_CACHE["snapshot"]
+    if snapshot is not None and snapshot["version"] == CATALOG_CACHE["version"]:
+        CATALOG_CACHE["hits"] += 1
+        return snapshot
+    async with _CATALOG_LOCK:
+        # 等锁期间可能已有其他请求重建完成
+        snapshot = CATALOG_CACHE["snapshot"]
+        if snapshot is not None and snapshot["version"] == CATALOG_CACHE["version"]:
+            CATALOG_CACHE["hits"] += 1
+            return snapshot
+        CATALOG_CACHE["misses"] += 1
+        # 先记下版本号：重建期间若有写入，版本会前进，下次请求自然重建
+        snapshot = await build_catalog_snapshot(
+            conn, CATALOG_CACHE["version"], CATALOG_CACHE["updated_at"]
+        )
+        CATALOG_CACHE["snapshot"] = snapshot
+        return snapshot
+
+
+async def insert_song(conn, name, artist, language, genre, url):
+    """Insert a song and its search row inside the caller's transaction; returns the new id."""
     cursor = await conn.execute(
-        "INSERT INTO songs (name, artist, language, genre, url) VALUES (?, ?, ?, ?, ?)",
-        (name, artist, language, genre, url),
+        """
+        INSERT INTO songs (name, artist, language, genre, url, sort_priority, sort_length, sort_name, updated_version)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, {})
+        """.format(PENDING_VERSION_SQL),
+        (name, artist, language, genre, url, *compute_sort_key(name, language)),
     )
     song_id = cursor.lastrowid
-    await conn.commit()
     await cursor.close()
+    await index_song_for_search(conn, song_id, name, artist, language, genre)
     return song_id
 
 
-async def update_song(conn, song_id, name, artist, language, genre, url):
-    await conn.execute(
+async def update_song_row(conn, song_id, name, artist, language, genre, url):
+    """Update a song and its search row inside the caller's transaction; returns False if the id is unknown."""
+    cursor = await conn.execute(
         """
         UPDATE songs
-        SET name = ?, artist = ?, language = ?, genre = ?, url = ?
+        SET name = ?, artist = ?, language = ?, genre = ?, url = ?,
+            sort_priority = ?, sort_length = ?, sort_name = ?, updated_version = {}
         WHERE id = ?
-        """,
-        (name, artist, language, genre, url, song_id),
+        """.format(PENDING_VERSION_SQL),
+        (name, artist, language, genre, url, *compute_sort_key(name, language), song_id),
     )
-    await conn.commit()
+    found = cursor.rowcount > 0
+    await cursor.close()
+    if found:
+        await index_song_for_search(conn, song_id, name, artist, language, genre)
+    return found
+
+
+async def delete_song_row(conn, song_id):
+    """Delete a song, its search row and leave a tombstone inside the caller's transaction."""
+    cursor = await conn.execute("DELETE FROM songs WHERE id = ?", (song_id,))
+    found = cursor.rowcount > 0
+    await cursor.close()
+    await conn.execute("DELETE FROM songs_fts WHERE rowid = ?", (song_id,))
+    if found:
+        await conn.execute(
+            f"INSERT OR REPLACE INTO song_tombstones (id, version, deleted_at) VALUES (?, {PENDING_VERSION_SQL}, ?)",
+            (song_id, time.time()),
+        )
+    return found
+
+
+async def add_song(conn, name, artist, language, genre, url):
+    try:
+        song_id = await insert_song(conn, name, artist, language, genre, url)
+        await bump_catalog_version(conn)
+        await conn.commit()
+    except BaseException:
+        await conn.rollback()
+        raise
+    return song_id
+
+
+async def update_song(conn, song_id, name, artist, language, genre, url):
+    """Returns False for an unknown id; the catalog version only moves when a row changed."""
+    try:
+        found = await update_song_row(conn, song_id, name, artist, language, genre, url)
+        if found:
+            await bump_catalog_version(conn)
+        await conn.commit()
+    except BaseException:
+        await conn.rollback()
+        raise
+    return found
 
 
 async def delete_song(conn, song_id):
-    await conn.execute("DELETE FROM songs WHERE id = ?", (song_id,))
-    await conn.commit()
+    """Returns False for an unknown id; the catalog version only moves when a row changed."""
+    try:
+        found = await delete_song_row(conn, song_id)
+        if found:
+            await bump_catalog_version(conn)
+        await conn.commit()
+    except BaseException:
+        await conn.rollback()
+        raise
+    return found
+
+
+BATCH_MAX_OPS = 1000
+BATCH_OPS = ("create", "update", "delete")
+
+
+def validate_batch_op(op):
+    """Normalise one /admin/batch item; raises ValueError with a message for the per-item result."""
+    if not isinstance(op, dict):
+        raise ValueError("操作应为对象")
+    kind = op.get("op")
+    if kind not in BATCH_OPS:
+        raise ValueError("op 仅支持 create、update 或 delete")
+    item = {"op": kind}
+    if kind in ("update", "delete"):
+        try:
+            item["id"] = int(op.get("id"))
+        except (TypeError, ValueError):
+            raise ValueError("缺少有效的歌曲 id")
+    if kind in ("create", "update"):
+        song = op.get("song")
+        if not isinstance(song, dict):
+            raise ValueError("缺少 song 字段")
+        values = {key: str(song.get(key) or "").strip() for key in SONG_FIELDS}
+        if not values["name"] or not values["artist"]:
+            raise ValueError("歌名和歌手不能为空")
+        values["url"] = values["url"] or "-"
+        item["song"] = values
+    return item
+
+
+def validate_song_batch(ops):
+    """Validate every op up front; returns ``(items, results)`` with ``status`` ``ok`` or ``error`` per op."""
+    items = []
+    results = []
+    for index, op in enumerate(ops):
+        try:
+            item = validate_batch_op(op)
+        except ValueError as exc:
+            item = None
+            kind = op.get("op") if isinstance(op, dict) else None
+            results.append({"index": index, "op": kind, "status": "error", "error": str(exc)})
+        else:
+            results.append({"index": index, "op": item["op"], "id": item.get("id"), "status": "ok"})
+        items.append(item)
+    return items, results
+
+
+async def apply_song_batch(conn, items, results):
+    """Apply validated ops in one transaction, all or nothing; returns whether the batch was committed.
+
+    ``results`` is updated in place: created/updated ops get ``song``; when an
+    update or delete hits an unknown id that op becomes ``error``, earlier ops
+    ``rolled_back`` and later ones ``skipped``. The caller holds app["write_lock"].
+    """
+    await conn.execute("BEGIN IMMEDIATE")
+    failed_at = None
+    try:
+        for index, item in enumerate(items):
+            result = results[index]
+            if item["op"] == "create":
+                result["id"] = await insert_song(conn, *(item["song"][key] for key in SONG_FIELDS))
+                result["song"] = {"id": result["id"], **item["song"]}
+            elif item["op"] == "update":
+                if not await update_song_row(conn, item["id"], *(item["song"][key] for key in SONG_FIELDS)):
+                    failed_at = index
+                    break
+                result["song"] = {"id": item["id"], **item["song"]}
+            elif not await delete_song_row(conn, item["id"]):
+                failed_at = index
+                break
+        if failed_at is None:
+            if items:
+                await bump_catalog_version(conn)
+            await conn.commit()
+        else:
+            await conn.rollback()
+    except BaseException:
+        await conn.rollback()
+        raise
+    if failed_at is None:
+        return True
+    for index, result in enumerate(results):
+        if index < failed_at:
+            result["status"] = "rolled_back"
+            result.pop("song", None)
+            if result["op"] == "create":
+                result["id"] = None
+        elif index == failed_at:
+            result.update(status="error", error=f"歌曲 {result['id']} 不存在")
+        else:
+            result["status"] = "skipped"
+    return False
+
+
+BACKUP_FETCH_SIZE = 500
+# 导出格式：文件扩展名与 Content-Type
+BACKUP_FORMATS = {
+    "json": ("json", "application/json"),
+    "ndjson": ("ndjson", "application/x-ndjson"),
+    "xlsx": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+async def iter_backup_chunks(conn, fmt="json"):
+    """Yield the songs table as compact JSON or NDJSON, BACKUP_FETCH_SIZE rows per chunk, straight from a cursor."""
+    cursor = await conn.execute("SELECT id, name, artist, language, genre, url FROM songs ORDER BY id ASC")
+    try:
+        first = True
+        if fmt == "json":
+            yield b"["
+        while True:
+            rows = await cursor.fetchmany(BACKUP_FETCH_SIZE)
+            if not rows:
+                break
+            encoded = [json.dumps(dict(row), ensure_ascii=False, separators=(",", ":")) for row in rows]
+            if fmt == "json":
+                chunk = ("" if first else ",") + ",".join(encoded)
+            else:
+                chunk = "".join(line + "\n" for line in encoded)
+            first = False
+            yield chunk.encode("utf-8")
+        if fmt == "json":
+            yield b"]"
+    finally:
+        await cursor.close()
+
+
+async def iter_gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
 
 
 async def backup_songs(conn, dest_path):
-    songs = await fetch_songs(conn)
     os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-    with open(dest_path, "w", encoding="utf-8") as f:
-        json.dump(songs, f, ensure_ascii=False, indent=2)
+    with atomic_output(dest_path) as f:
+        async for chunk in iter_backup_chunks(conn):
+            f.write(chunk)
     return dest_path
 
 
@@ -538,6 +2481,14 @@ def parse_backup_json(text: str):
     data = json.loads(text)
     if not isinstance(data, list):
         raise ValueError("备份格式错误：根节点应为列表")
+    return validate_backup_items(data)
+
+
+def parse_backup_ndjson(text: str):
+    return validate_backup_items([json.loads(line) for line in text.splitlines() if line.strip()])
+
+
+def validate_backup_items(data):
     for item in data:
         if not isinstance(item, dict):
             raise ValueError("备份格式错误：列表元素应为对象")
@@ -547,55 +2498,303 @@ def parse_backup_json(text: str):
     return data
 
 
-async def restore_songs_from_data(conn, songs):
-    # 清空并恢复
-    await conn.execute("DELETE FROM songs")
-    for s in songs:
-        await add_song(
-            conn,
-            s.get("name", ""),
-            s.get("artist", ""),
-            s.get("language", ""),
-            s.get("genre", ""),
-            s.get("url", "-"),
+RESTORE_BATCH_SIZE = 500
+SONG_FIELDS = ("name", "artist", "language", "genre", "url")
+
+
+def normalize_backup_song(song):
+    values = {key: "" if song.get(key) is None else str(song.get(key)) for key in SONG_FIELDS}
+    values["url"] = values["url"] or "-"
+    return values
+
+
+def song_merge_key(name, artist):
+    """合并恢复时用来对齐歌曲的键：歌名 + 歌手，忽略首尾空白和大小写。"""
+    return (name.strip().lower(), artist.strip().lower())
+
+
+def prepare_song_rows(songs, ids):
+    """Rows for songs (with sort keys) and songs_fts; pinyin makes this CPU-bound, so it runs off the loop."""
+    song_rows = []
+    search_rows = []
+    for song_id, song in zip(ids, songs):
+        name, artist, language, genre, url = (song[key] for key in SONG_FIELDS)
+        song_rows.append((name, artist, language, genre, url, *compute_sort_key(name, language), song_id))
+        search_rows.append(song_search_row(song_id, name, artist, language, genre))
+    return song_rows, search_rows
+
+
+async def executemany_batched(conn, sql, rows, batch_size=RESTORE_BATCH_SIZE):
+    for start in range(0, len(rows), batch_size):
+        await conn.executemany(sql, rows[start:start + batch_size])
+
+
+async def next_song_id(conn):
+    """Next id AUTOINCREMENT would hand out (ids are assigned up front so FTS rows can be batched)."""
+    cursor = await conn.execute(
+        """
+        SELECT MAX(
+            COALESCE((SELECT MAX(id) FROM songs), 0),
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'songs'), 0)
+        ) + 1
+        """
+    )
+    row = await cursor.fetchone()
+    await cursor.close()
+    return row[0]
+
+
+async def insert_song_rows(conn, songs, first_id):
+    song_rows, search_rows = await asyncio.to_thread(prepare_song_rows, songs, range(first_id, first_id + len(songs)))
+    await executemany_batched(
+        conn,
+        """
+        INSERT INTO songs (name, artist, language, genre, url, sort_priority, sort_length, sort_name, id, updated_version)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, {})
+        """.format(PENDING_VERSION_SQL),
+        song_rows,
+    )
+    await executemany_batched(conn, SEARCH_INSERT_SQL, search_rows)
+
+
+async def iter_song_batches(songs, batch_size=RESTORE_BATCH_SIZE):
+    for start in range(0, len(songs), batch_size):
+        yield songs[start:start + batch_size]
+
+
+async def restore_songs_from_data(conn, songs, mode="replace"):
+    return await restore_song_batches(conn, iter_song_batches(songs), mode=mode)
+
+
+async def restore_song_batches(conn, batches, mode="replace", on_progress=None):
+    """Restore songs from an async iterator of batches in one transaction.
+
+    ``replace`` empties the table first and inserts each batch as it arrives;
+    ``merge`` matches rows by song_merge_key (so it collects the incoming
+    songs first), inserts new songs, updates changed ones and deletes
+    nothing. ``on_progress(rows_read)`` is called after every batch. Returns
+    counts plus elapsed seconds and rows per second. The caller holds
+    app["write_lock"] for the whole restore.
+    """
+    if mode not in ("replace", "merge"):
+        raise ValueError("未知的恢复模式")
+    started = time.perf_counter()
+    stats = {"mode": mode, "total": 0, "inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+    await conn.execute("BEGIN IMMEDIATE")
+    try:
+        if mode == "merge":
+            incoming = {}
+            async for batch in batches:
+                for song in batch:
+                    song = normalize_backup_song(song)
+                    incoming[song_merge_key(song["name"], song["artist"])] = song
+                stats["total"] += len(batch)
+                if on_progress:
+                    on_progress(stats["total"])
+            cursor = await conn.execute("SELECT id, name, artist, language, genre, url FROM songs ORDER BY id")
+            existing = {}
+            for row in await cursor.fetchall():
+                existing.setdefault(song_merge_key(row["name"], row["artist"]), row)
+            await cursor.close()
+            inserts = []
+            updates = []
+            for key, song in incoming.items():
+                row = existing.get(key)
+                if row is None:
+                    inserts.append(song)
+                elif tuple(row[field] for field in SONG_FIELDS) != tuple(song[field] for field in SONG_FIELDS):
+                    updates.append((row["id"], song))
+                else:
+                    stats["unchanged"] += 1
+            await insert_song_rows(conn, inserts, await next_song_id(conn))
+            stats["inserted"] = len(inserts)
+            if updates:
+                update_rows, update_search_rows = await asyncio.to_thread(
+                    prepare_song_rows, [song for _, song in updates], [song_id for song_id, _ in updates]
+                )
+                await executemany_batched(
+                    conn,
+                    """
+                    UPDATE songs
+                    SET name = ?, artist = ?, language = ?, genre = ?, url = ?,
+                        sort_priority = ?, sort_length = ?, sort_name = ?, updated_version = {}
+                    WHERE id = ?
+                    """.format(PENDING_VERSION_SQL),
+                    update_rows,
+                )
+                await executemany_batched(
+                    conn, "DELETE FROM songs_fts WHERE rowid = ?", [(song_id,) for song_id, _ in updates]
+                )
+                await executemany_batched(conn, SEARCH_INSERT_SQL, update_search_rows)
+            stats["updated"] = len(updates)
+        else:
+            cursor = await conn.execute("DELETE FROM songs")
+            stats["deleted"] = cursor.rowcount
+            await cursor.close()
+            await conn.execute("DELETE FROM songs_fts")
+            if stats["deleted"]:
+                # 整表替换不逐条记墓碑：旧版本的客户端一律重置
+                await conn.execute("DELETE FROM song_tombstones")
+                await conn.execute("UPDATE catalog_meta SET changes_from = version + 1 WHERE id = 1")
+            next_id = await next_song_id(conn)
+            async for batch in batches:
+                batch = [normalize_backup_song(song) for song in batch]
+                await insert_song_rows(conn, batch, next_id)
+                next_id += len(batch)
+                stats["total"] += len(batch)
+                if on_progress:
+                    on_progress(stats["total"])
+            stats["inserted"] = stats["total"]
+        if stats["inserted"] or stats["updated"] or stats["deleted"]:
+            await bump_catalog_version(conn)
+        await conn.commit()
+    except BaseException:
+        await conn.rollback()
+        raise
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    stats["rows_per_sec"] = round(stats["total"] / stats["seconds"]) if stats["seconds"] else stats["total"]
+    return stats
+
+
+def restore_message(source, stats):
+    if stats["mode"] == "merge":
+        return (
+            f"已从{source}合并恢复：新增 {stats['inserted']}，更新 {stats['updated']}，"
+            f"未变 {stats['unchanged']}（{stats['rows_per_sec']} 行/秒）"
         )
-    await conn.commit()
-    return len(songs)
+    return f"已从{source}恢复 {stats['inserted']} 首歌曲（{stats['rows_per_sec']} 行/秒）"
+
+
+XLSX_HEADER = ["歌名", "歌手", "语言", "风格", "url"]
 
 
-def parse_backup_xlsx(data: bytes):
+def load_backup_workbook(source, write_only=False):
     try:
-        from openpyxl import load_workbook
+        from openpyxl import Workbook, load_workbook
     except ImportError:
-        raise ImportError("未安装 openpyxl，无法解析 xlsx，请先安装 openpyxl")
-
-    wb = load_workbook(io.BytesIO(data))
-    ws = wb.active
-    rows = list(ws.iter_rows(values_only=True))
-    if not rows:
-        return []
-    header = [str(h).strip() if h is not None else "" for h in rows[0]]
-    required = ["歌名", "歌手", "语言", "风格", "url"]
-    if header[:5] != required:
-        raise ValueError(f"xlsx 表头需为：{' | '.join(required)}")
-    songs = []
-    for row in rows[1:]:
+        raise ImportError("未安装 openpyxl，无法处理 xlsx，请先安装 openpyxl")
+    if write_only:
+        return Workbook(write_only=True)
+    # 只读模式按行流式解析，不把整个工作簿读进内存；公式单元格取缓存的计算结果
+    return load_workbook(source, read_only=True, data_only=True)
+
+
+def iter_backup_xlsx(ws):
+    """Yield song dicts from a worksheet row by row, checking the header first."""
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    header = [str(h).strip() if h is not None else "" for h in header]
+    if header[:5] != XLSX_HEADER:
+        raise ValueError(f"xlsx 表头需为：{' | '.join(XLSX_HEADER)}")
+    for row in rows:
         if row is None:
             continue
         vals = list(row) + [""] * (5 - len(row))
         name, artist, language, genre, url = ["" if v is None else str(v) for v in vals[:5]]
         if not name and not artist:
             continue
-        songs.append(
-            {
-                "name": name,
-                "artist": artist,
-                "language": language,
-                "genre": genre,
-                "url": url or "-",
-            }
+        yield {
+            "name": name,
+            "artist": artist,
+            "language": language,
+            "genre": genre,
+            "url": url or "-",
+        }
+
+
+async def iter_xlsx_song_batches(data: bytes, batch_size=RESTORE_BATCH_SIZE, on_open=None):
+    """Parse an uploaded workbook in a worker thread, one batch of rows at a time."""
+    wb = await asyncio.to_thread(load_backup_workbook, io.BytesIO(data))
+    try:
+        ws = wb.active
+        if on_open:
+            # 工作表声明的行数（不含表头），只用作进度的估计值
+            on_open(max((ws.max_row or 1) - 1, 0))
+        rows = iter_backup_xlsx(ws)
+        while True:
+            batch = await asyncio.to_thread(list, itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            yield batch
+    finally:
+        wb.close()
+
+
+async def prepend_batch(first, batches):
+    if first is not None:
+        yield first
+    async for batch in batches:
+        yield batch
+
+
+def append_xlsx_rows(ws, rows):
+    for row in rows:
+        ws.append([row[key] for key in SONG_FIELDS])
+
+
+async def export_backup_xlsx(conn, fp):
+    """Export the songs table into a write-only workbook (rows spool to a temp file, not memory), built off the loop."""
+    wb = await asyncio.to_thread(load_backup_workbook, None, True)
+    ws = wb.create_sheet("songs")
+    ws.append(XLSX_HEADER)
+    cursor = await conn.execute("SELECT name, artist, language, genre, url FROM songs ORDER BY id ASC")
+    try:
+        while True:
+            rows = await cursor.fetchmany(BACKUP_FETCH_SIZE)
+            if not rows:
+                break
+            await asyncio.to_thread(append_xlsx_rows, ws, rows)
+    finally:
+        await cursor.close()
+    await asyncio.to_thread(wb.save, fp)
+
+
+async def run_import_job(app, job_id, data, mode):
+    jobs = app["render_jobs"]
+    estimate = {"total": 0}
+
+    def on_open(total):
+        estimate["total"] = total
+        jobs.update(job_id, status="running", progress={"done": 0, "total": total})
+
+    def on_progress(done):
+        jobs.update(job_id, progress={"done": done, "total": max(done, estimate["total"])})
+
+    batches = iter_xlsx_song_batches(data, on_open=on_open)
+    try:
+        # 锁外先打开工作簿并读出第一批（含表头校验）：坏文件直接失败，不占用写锁
+        first = await anext(batches, None)
+        # 导入期间其他写操作排队等待，整个导入仍是一个事务
+        async with app["write_lock"]:
+            stats = await restore_song_batches(
+                app["db_conn"], prepend_batch(first, batches), mode=mode, on_progress=on_progress
+            )
+        jobs.update(
+            job_id,
+            status="done",
+            progress={"done": stats["total"], "total": stats["total"]},
+            result={**stats, "message": restore_message("上传的 xlsx", stats)},
         )
-    return songs
+    except asyncio.CancelledError:
+        jobs.update(job_id, status="failed", error="服务已停止，任务被取消")
+        raise
+    except Exception as exc:
+        jobs.update(job_id, status="failed", error=f"恢复失败: {exc}")
+    finally:
+        await batches.aclose()
+
+
+def submit_import_job(app, data, mode):
+    """Import an uploaded workbook in the background; progress shows up in the job list."""
+    if mode not in ("replace", "merge"):
+        raise ValueError("未知的恢复模式")
+    job = app["render_jobs"].create("xlsx_import")
+    task = asyncio.ensure_future(run_import_job(app, job["id"], data, mode))
+    app["render_tasks"].add(task)
+    task.add_done_callback(app["render_tasks"].discard)
+    return job
 
 
 def require_admin(request, form=None):
@@ -616,31 +2815,446 @@ def require_admin(request, form=None):
     raise web.HTTPFound(location=f"/admin/login?next={next_url}")
 
 
+async def serve_cached_response(request, cache, key, snapshot, render):
+    """Serve a body cached per catalog version, answering conditional requests with 304.
+
+    ``render(snapshot)`` returns ``(body_bytes, content_type)`` and only runs on a miss.
+    """
+    entry = cache["entries"].get(key)
+    if entry is not None and entry["version"] == snapshot["version"]:
+        cache["hits"] += 1
+    else:
+        cache["misses"] += 1
+        body, content_type = render(snapshot)
+        entry = {
+            "version": snapshot["version"],
+            "body": body,
+            "gzip": None,
+            "content_type": content_type,
+            "etag": '"%s"' % hashlib.sha256(body).hexdigest()[:32],
+            "last_modified": snapshot["updated_at"],
+        }
+        if entry["version"] == CATALOG_CACHE["version"]:
+            cache["entries"][key] = entry
+    use_gzip = len(entry["body"]) > 1024 and "gzip" in request.headers.get("Accept-Encoding", "")
+    # 强校验器要区分内容编码：gzip 版本的 ETag 带 -gzip 后缀
+    etag = entry["etag"][:-1] + '-gzip"' if use_gzip else entry["etag"]
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(entry["last_modified"], usegmt=True),
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if is_not_modified(request, etag, entry["last_modified"]):
+        cache["not_modified"] += 1
+        return web.Response(status=304, headers=headers)
+    body = entry["body"]
+    if use_gzip:
+        # 压缩结果随条目一起缓存，同一版本只压缩一次
+        if entry["gzip"] is None:
+            entry["gzip"] = gzip.compress(body, compresslevel=6)
+        body = entry["gzip"]
+        headers["Content-Encoding"] = "gzip"
+    return web.Response(body=body, content_type=entry["content_type"], charset="utf-8", headers=headers)
+
+
+def resolve_render_mode(request, song_count):
+    """full：服务端渲染全部歌曲；virtual：前端拉取 /api/songs 后只渲染可见行。"""
+    requested = request.query.get("render")
+    if requested in ("full", "virtual"):
+        return requested
+    threshold = request.app["config"].virtual_render_threshold()
+    return "virtual" if threshold and song_count > threshold else "full"
+
+
 async def index(request):
-    conn = request.app["db_conn"]
-    songs = await fetch_songs_sorted(conn)
-    languages = await fetch_unique_languages(conn)
-    genres = await fetch_unique_genres(conn)
-    settings = await get_settings(conn)
-    return aiohttp_jinja2.render_template(
-        "index.html",
-        request,
-        {"songs": songs, "languages": languages, "genres": genres, "settings": settings},
+    async with request.app["db_readers"].acquire() as conn:
+        snapshot = await get_catalog_snapshot(conn)
+    render_mode = resolve_render_mode(request, len(snapshot["songs"]))
+
+    def render(snapshot):
+        html = aiohttp_jinja2.render_string(
+            "index.html",
+            request,
+            {
+                "songs": snapshot["songs"] if render_mode == "full" else [],
+                "songs_by_language": snapshot["songs_by_language"] if render_mode == "full" else [],
+                "languages": snapshot["languages"],
+                "genres": snapshot["genres"],
+                "settings": snapshot["settings"],
+                "render_mode": render_mode,
+                "catalog_version": snapshot["version"],
+            },
+        )
+        return html.encode("utf-8"), "text/html"
+
+    return await serve_cached_response(request, PAGE_CACHE, render_mode, snapshot, render)
+
+
+def render_catalog_json(snapshot):
+    payload = {
+        "version": snapshot["version"],
+        "languages": snapshot["languages"],
+        "genres": snapshot["genres"],
+        "fields": CATALOG_FIELDS,
+        # 每首歌一行数组，字段顺序见 fields，比对象列表小得多
+        "songs": [[song[field] for field in CATALOG_FIELDS] for song in snapshot["songs"]],
+    }
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return body, "application/json"
+
+
+async def api_songs_catalog(request):
+    """GET /api/songs: compact, versioned catalog JSON for the virtual renderer and mirrors."""
+    async with request.app["db_readers"].acquire() as conn:
+        snapshot = await get_catalog_snapshot(conn)
+    return await serve_cached_response(request, CATALOG_JSON_CACHE, "catalog", snapshot, render_catalog_json)
+
+
+async def fetch_song_changes(conn, since):
+    """Songs written and ids deleted after catalog version ``since``.
+
+    ``reset`` is set when the change log cannot cover ``since`` (older than
+    changes_from or newer than the current version); ``songs`` is then the
+    whole catalog and the client should replace its copy.
+    """
+    cursor = await conn.execute("SELECT version, changes_from FROM catalog_meta WHERE id = 1")
+    meta = await cursor.fetchone()
+    await cursor.close()
+    reset = since < meta["changes_from"] or since > meta["version"]
+    columns = ", ".join(CATALOG_FIELDS)
+    if reset:
+        cursor = await conn.execute(f"SELECT {columns} FROM songs ORDER BY id")
+    else:
+        cursor = await conn.execute(f"SELECT {columns} FROM songs WHERE updated_version > ? ORDER BY id", (since,))
+    songs = [[row[field] for field in CATALOG_FIELDS] for row in await cursor.fetchall()]
+    await cursor.close()
+    deleted = []
+    if not reset:
+        cursor = await conn.execute("SELECT id FROM song_tombstones WHERE version > ? ORDER BY id", (since,))
+        deleted = [row["id"] for row in await cursor.fetchall()]
+        await cursor.close()
+    return {
+        "version": meta["version"],
+        "since": since,
+        "reset": reset,
+        "fields": CATALOG_FIELDS,
+        "songs": songs,
+        "deleted": deleted,
+    }
+
+
+async def api_song_changes(request):
+    """GET /api/songs/changes?since=<version>: songs inserted/updated and ids deleted since a catalog version."""
+    try:
+        since = int(request.query["since"])
+    except (KeyError, ValueError):
+        raise web.HTTPBadRequest(text="since 需要是整数版本号")
+    if since < 0:
+        raise web.HTTPBadRequest(text="since 需要是整数版本号")
+    # 三次查询放在同一个读事务里，避免中途提交的写入造成不一致
+    async with request.app["db_readers"].acquire(snapshot=True) as conn:
+        payload = await fetch_song_changes(conn, since)
+    body = json.dumps({"ok": True, **payload}, ensure_ascii=False, separators=(",", ":"))
+    return web.Response(text=body, content_type="application/json", headers={"Cache-Control": "no-cache"})
+
+
+async def api_search_songs(request):
+    """GET /api/songs/search?q=&language=&genre=&page=&page_size="""
+    try:
+        page = max(int(request.query.get("page", 1)), 1)
+        page_size = int(request.query.get("page_size", SEARCH_PAGE_SIZE))
+    except ValueError:
+        raise web.HTTPBadRequest(text="page/page_size 需要是整数")
+    page_size = min(max(page_size, 1), SEARCH_PAGE_SIZE_MAX)
+    query = request.query.get("q", "").strip()
+    async with request.app["db_readers"].acquire() as conn:
+        total, songs = await search_songs(
+            conn,
+            query,
+            language=request.query.get("language", "").strip() or None,
+            genre=request.query.get("genre", "").strip() or None,
+            page=page,
+            page_size=page_size,
+        )
+    return web.json_response(
+        {"ok": True, "q": query, "page": page, "page_size": page_size, "total": total, "songs": songs}
+    )
+
+
+class ImageProxyError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"')
+    return directives
+
+
+class ImageProxy:
+    """Fetch upstream images over a shared session with a memory + disk LRU cache.
+
+    Entries honour upstream Cache-Control (max-age / no-cache / no-store) and are
+    revalidated with ETag / Last-Modified once stale. Concurrent requests for the
+    same URL share one in-flight fetch; bodies are streamed with a size cap.
+    """
+
+    def __init__(
+        self,
+        session,
+        cache_dir,
+        memory_bytes=32 * 1024 * 1024,
+        disk_bytes=512 * 1024 * 1024,
+        default_ttl=3600,
+        max_body=10 * 1024 * 1024,
+        upstream_headers=None,
+    ):
+        self.session = session
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.default_ttl = default_ttl
+        self.max_body = max_body
+        self.upstream_headers = upstream_headers or {"Referer": "https://www.bilibili.com"}
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk = OrderedDict()
+        self._disk_size = 0
+        self._inflight = {}
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "revalidated": 0,
+            "shared_inflight": 0,
+            "errors": 0,
+        }
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def _load_disk_index(self):
+        files = []
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith(".bin"):
+                continue
+            path = os.path.join(self.cache_dir, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, filename[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk[key] = size
+            self._disk_size += size
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + ".bin", base + ".json"
+
+    def _remember(self, key, entry):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old["body"])
+        if len(entry["body"]) > self.memory_bytes:
+            return
+        self._memory[key] = entry
+        self._memory_size += len(entry["body"])
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted["body"])
+
+    def _read_disk(self, key):
+        body_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+            os.utime(body_path)
+        except (OSError, ValueError):
+            return None
+        meta["body"] = body
+        return meta
+
+    def _write_disk(self, key, entry):
+        body_path, meta_path = self._paths(key)
+        meta = {k: v for k, v in entry.items() if k != "body"}
+        # 先写临时文件再替换，避免并发读到半个文件
+        for path, data, mode in ((body_path, entry["body"], "wb"), (meta_path, json.dumps(meta), "w")):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, mode) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+    def _remove_disk(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    async def _store_disk(self, key, entry):
+        if not self.cache_dir or len(entry["body"]) > self.disk_bytes:
+            return
+        await asyncio.to_thread(self._write_disk, key, entry)
+        self._disk_size -= self._disk.pop(key, 0)
+        self._disk[key] = len(entry["body"])
+        self._disk_size += len(entry["body"])
+        evicted = []
+        while self._disk_size > self.disk_bytes and self._disk:
+            old_key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            evicted.append(old_key)
+        for old_key in evicted:
+            await asyncio.to_thread(self._remove_disk, old_key)
+
+    def _expires_at(self, headers):
+        directives = parse_cache_control(headers.get("Cache-Control"))
+        if "no-store" in directives:
+            return None
+        if "no-cache" in directives:
+            return time.time()
+        max_age = directives.get("s-maxage") or directives.get("max-age")
+        try:
+            ttl = int(max_age) if max_age is not None else self.default_ttl
+        except ValueError:
+            ttl = self.default_ttl
+        return time.time() + max(ttl, 0)
+
+    async def get(self, url):
+        """Return a cache entry dict: body, content_type, etag, last_modified, expires."""
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            if entry["expires"] > time.time():
+                self.stats["memory_hits"] += 1
+                return entry
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["shared_inflight"] += 1
+        else:
+            task = asyncio.ensure_future(self._load(key, url, entry))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield：单个客户端断开不应取消其他等待者共享的抓取
+        return await asyncio.shield(task)
+
+    async def _load(self, key, url, stale):
+        if stale is None and key in self._disk:
+            stale = await asyncio.to_thread(self._read_disk, key)
+            if stale is None:
+                self._disk_size -= self._disk.pop(key, 0)
+            else:
+                self._disk.move_to_end(key)
+                if stale["expires"] > time.time():
+                    self.stats["disk_hits"] += 1
+                    self._remember(key, stale)
+                    return stale
+        try:
+            entry = await self._fetch(url, stale)
+        except ImageProxyError:
+            self.stats["errors"] += 1
+            raise
+        if entry["expires"] is None:
+            return entry
+        self._remember(key, entry)
+        await self._store_disk(key, entry)
+        return entry
+
+    async def _fetch(self, url, stale):
+        headers = dict(self.upstream_headers)
+        if stale is not None:
+            if stale.get("etag"):
+                headers["If-None-Match"] = stale["etag"]
+            if stale.get("last_modified"):
+                headers["If-Modified-Since"] = stale["last_modified"]
+        try:
+            async with self.session.get(url, headers=headers) as response:
+                if response.status == 304 and stale is not None:
+                    self.stats["revalidated"] += 1
+                    expires = self._expires_at(response.headers)
+                    return dict(stale, expires=expires if expires is not None else time.time())
+                if response.status != 200:
+                    raise ImageProxyError(404, "Image not found")
+                content_type = response.headers.get("Content-Type", "")
+                if not content_type.startswith("image/"):
+                    raise ImageProxyError(404, "Image not found")
+                length = response.content_length
+                if length is not None and length > self.max_body:
+                    raise ImageProxyError(413, "Image too large")
+                chunks = []
+                received = 0
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    received += len(chunk)
+                    if received > self.max_body:
+                        raise ImageProxyError(413, "Image too large")
+                    chunks.append(chunk)
+                self.stats["misses"] += 1
+                return {
+                    "url": url,
+                    "body": b"".join(chunks),
+                    "content_type": content_type,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "expires": self._expires_at(response.headers),
+                }
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            raise ImageProxyError(502, f"Upstream error: {exc.__class__.__name__}")
+
+    def cache_stats(self):
+        return dict(
+            self.stats,
+            memory_entries=len(self._memory),
+            memory_bytes=self._memory_size,
+            disk_entries=len(self._disk),
+            disk_bytes=self._disk_size,
+            inflight=len(self._inflight),
+        )
+
+
+async def image_proxy_ctx(app):
+    """Create the shared upstream session at startup and close it on shutdown."""
+    options = app["config"].image_proxy_options()
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=options["connections"], ttl_dns_cache=300),
+        timeout=aiohttp.ClientTimeout(total=options["timeout"]),
     )
+    app["image_proxy"] = ImageProxy(
+        session,
+        options["cache_dir"],
+        memory_bytes=options["memory_bytes"],
+        disk_bytes=options["disk_bytes"],
+        default_ttl=options["default_ttl"],
+        max_body=options["max_body"],
+    )
+    yield
+    await session.close()
 
 
 async def proxy_image(request):
     image_url = request.query.get("url")
     if not image_url:
         raise web.HTTPBadRequest(text="Missing 'url' parameter")
-    headers = {"Referer": "https://www.bilibili.com"}
-    async with aiohttp.ClientSession() as session:
-        async with session.get(image_url, headers=headers) as response:
-            if response.status == 200:
-                return web.Response(
-                    body=await response.read(), content_type=response.headers["Content-Type"]
-                )
-            raise web.HTTPNotFound(text="Image not found")
+    if not image_url.startswith(("http://", "https://")):
+        raise web.HTTPBadRequest(text="Invalid 'url' parameter")
+    try:
+        entry = await request.app["image_proxy"].get(image_url)
+    except ImageProxyError as exc:
+        return web.Response(status=exc.status, text=str(exc))
+    headers = {"Cache-Control": f"public, max-age={max(int((entry['expires'] or 0) - time.time()), 0)}"}
+    if entry.get("etag"):
+        headers["ETag"] = entry["etag"]
+        if request.headers.get("If-None-Match") == entry["etag"]:
+            return web.Response(status=304, headers=headers)
+    return web.Response(body=entry["body"], content_type=entry["content_type"].split(";")[0], headers=headers)
 
 
 async def admin_login_get(request):
@@ -660,7 +3274,8 @@ async def admin_login_get(request):
 
 async def admin_login_post(request):
     ip = (request.headers.get("X-Forwarded-For", "").split(",")[0].strip() or request.remote or "unknown")
-    remaining, wait = _login_attempts_info(ip)
+    async with request.app["db_readers"].acquire() as conn:
+        remaining, wait = await _login_attempts_info(conn, ip)
     if remaining == 0:
         return aiohttp_jinja2.render_template(
             "admin_login.html",
@@ -681,10 +3296,12 @@ async def admin_login_post(request):
     if token_cfg and provided == token_cfg:
         resp = web.HTTPFound(location=next_url)
         resp.set_cookie("admin_token", provided, httponly=True, samesite="Lax")
-        _reset_login_failure(ip)
+        async with request.app["write_lock"]:
+            await _reset_login_failure(request.app["db_conn"], ip)
         return resp
-    _add_login_failure(ip)
-    remaining_after, wait_after = _login_attempts_info(ip)
+    async with request.app["write_lock"]:
+        await _add_login_failure(request.app["db_conn"], ip)
+        remaining_after, wait_after = await _login_attempts_info(request.app["db_conn"], ip)
     message_text = "Token 错误或未设置"
     if remaining_after > 0:
         message_text += f"；还可再试 {remaining_after} 次"
@@ -746,9 +3363,10 @@ async def admin_setup_post(request):
 
 async def admin_page(request):
     _ = require_admin(request)
-    conn = request.app["db_conn"]
-    songs = await fetch_songs(conn)
-    settings = await get_settings(conn)
+    async with request.app["db_readers"].acquire() as conn:
+        await refresh_catalog_version(conn)
+        songs = await fetch_songs(conn)
+        settings = await get_settings(conn)
     return aiohttp_jinja2.render_template(
         "admin.html",
         request,
@@ -776,7 +3394,8 @@ async def admin_action(request):
             language = form.get("language", "").strip()
             genre = form.get("genre", "").strip()
             url = form.get("url", "").strip() or "-"
-            new_id = await add_song(conn, name, artist, language, genre, url)
+            async with request.app["write_lock"]:
+                new_id = await add_song(conn, name, artist, language, genre, url)
             message = "歌曲已添加"
             if wants_json(request):
                 return web.json_response({"ok": True, "action": "song_new", "song": {
@@ -789,37 +3408,60 @@ async def admin_action(request):
             language = form.get("language", "").strip()
             genre = form.get("genre", "").strip()
             url = form.get("url", "").strip() or "-"
-            await update_song(conn, song_id, name, artist, language, genre, url)
+            async with request.app["write_lock"]:
+                found = await update_song(conn, song_id, name, artist, language, genre, url)
+            if not found:
+                raise ValueError(f"歌曲 {song_id} 不存在")
             message = "歌曲已更新"
             if wants_json(request):
                 return web.json_response({"ok": True, "action": "song_update", "song_id": song_id})
         elif action == "song_delete":
             song_id = int(form.get("song_id", 0))
-            await delete_song(conn, song_id)
+            async with request.app["write_lock"]:
+                found = await delete_song(conn, song_id)
+            if not found:
+                raise ValueError(f"歌曲 {song_id} 不存在")
             message = "歌曲已删除"
             if wants_json(request):
                 return web.json_response({"ok": True, "action": "song_delete", "song_id": song_id})
         elif action == "backup":
             dest = os.path.join("backup", "songs_backup.json")
-            saved = await backup_songs(conn, dest)
+            async with request.app["db_readers"].acquire() as reader:
+                saved = await backup_songs(reader, dest)
             message = f"备份已生成: {saved}"
         elif action == "restore_backup":
             file_field = form.get("backup_file")
+            restore_mode = form.get("restore_mode") or "replace"
             try:
                 if file_field and hasattr(file_field, "file") and file_field.filename:
                     filename = file_field.filename.lower()
+                    content = file_field.file.read()
+                    if filename.endswith(".gz"):
+                        content = gzip.decompress(content)
+                        filename = filename[:-3]
+                    if filename.endswith(".xlsx"):
+                        # xlsx 可能有数万行，放到后台任务里边解析边写入，进度显示在任务列表
+                        job = submit_import_job(request.app, content, restore_mode)
+                        message = "xlsx 导入任务已提交"
+                        if wants_json(request):
+                            return web.json_response(
+                                {"ok": True, "action": "restore_backup", "message": message, "job": public_job(job)},
+                                status=202,
+                            )
+                        return web.HTTPFound(location="/admin?message=" + quote(message) + "#jobs")
                     if filename.endswith(".json"):
-                        content = file_field.file.read().decode("utf-8")
-                        songs = parse_backup_json(content)
-                    elif filename.endswith(".xlsx"):
-                        content = file_field.file.read()
-                        songs = parse_backup_xlsx(content)
+                        songs = parse_backup_json(content.decode("utf-8"))
+                    elif filename.endswith((".ndjson", ".jsonl")):
+                        songs = parse_backup_ndjson(content.decode("utf-8"))
                     else:
-                        raise ValueError("仅支持 .json 或 .xlsx 备份文件")
-                    count = await restore_songs_from_data(conn, songs)
-                    message = f"已从上传的备份恢复 {count} 首歌曲"
+                        raise ValueError("仅支持 .json、.ndjson（可 gzip 压缩）或 .xlsx 备份文件")
+                    async with request.app["write_lock"]:
+                        stats = await restore_songs_from_data(conn, songs, mode=restore_mode)
+                    message = restore_message("上传的备份", stats)
                     if wants_json(request):
-                        return web.json_response({"ok": True, "action": "restore_backup", "count": count})
+                        return web.json_response(
+                            {"ok": True, "action": "restore_backup", "count": stats["total"], "stats": stats}
+                        )
                 else:
                     src = os.path.join("backup", "songs_backup.json")
                     if not os.path.exists(src):
@@ -827,33 +3469,45 @@ async def admin_action(request):
                     with open(src, "r", encoding="utf-8") as f:
                         content = f.read()
                     songs = parse_backup_json(content)
-                    count = await restore_songs_from_data(conn, songs)
-                    message = f"已从本地备份恢复 {count} 首歌曲"
+                    async with request.app["write_lock"]:
+                        stats = await restore_songs_from_data(conn, songs, mode=restore_mode)
+                    message = restore_message("本地备份", stats)
                     if wants_json(request):
-                        return web.json_response({"ok": True, "action": "restore_backup", "count": count})
+                        return web.json_response(
+                            {"ok": True, "action": "restore_backup", "count": stats["total"], "stats": stats}
+                        )
             except Exception as exc:
                 message = f"恢复失败: {exc}"
         elif action == "settings":
-            current_settings = await get_settings(conn)
             bg_file = form.get("background_file")
             singer_file = form.get("singer_file")
-            new_settings = {
-                "title": form.get("title", "").strip() or current_settings.get("title", DEFAULT_SETTINGS["title"]),
-                "live_url": form.get("live_url", "").strip() or current_settings.get("live_url", DEFAULT_SETTINGS["live_url"]),
-                "singer_name": form.get("singer_name", "").strip() or current_settings.get("singer_name", DEFAULT_SETTINGS["singer_name"]),
-                "singer_intro": form.get("singer_intro", "").strip() or current_settings.get("singer_intro", DEFAULT_SETTINGS["singer_intro"]),
-                "background_url": current_settings.get("background_url", DEFAULT_SETTINGS["background_url"]),
-                "singer_url": current_settings.get("singer_url", DEFAULT_SETTINGS["singer_url"]),
-            }
+            uploads = {}
             if hasattr(bg_file, "file") and bg_file.filename:
                 saved = save_file_field(bg_file, "bg")
                 if saved:
-                    new_settings["background_url"] = saved
+                    uploads["background_url"] = saved
             if hasattr(singer_file, "file") and singer_file.filename:
                 saved = save_file_field(singer_file, "singer")
                 if saved:
-                    new_settings["singer_url"] = saved
-            await update_settings(conn, new_settings)
+                    uploads["singer_url"] = saved
+            async with request.app["write_lock"]:
+                # 在写事务里直接读库：本进程的设置缓存可能落后于其他 worker 的修改
+                await conn.execute("BEGIN IMMEDIATE")
+                try:
+                    current_settings = await read_settings(conn)
+                except BaseException:
+                    await conn.rollback()
+                    raise
+                new_settings = {
+                    "title": form.get("title", "").strip() or current_settings.get("title", DEFAULT_SETTINGS["title"]),
+                    "live_url": form.get("live_url", "").strip() or current_settings.get("live_url", DEFAULT_SETTINGS["live_url"]),
+                    "singer_name": form.get("singer_name", "").strip() or current_settings.get("singer_name", DEFAULT_SETTINGS["singer_name"]),
+                    "singer_intro": form.get("singer_intro", "").strip() or current_settings.get("singer_intro", DEFAULT_SETTINGS["singer_intro"]),
+                    "background_url": current_settings.get("background_url", DEFAULT_SETTINGS["background_url"]),
+                    "singer_url": current_settings.get("singer_url", DEFAULT_SETTINGS["singer_url"]),
+                    **uploads,
+                }
+                await update_settings(conn, new_settings)
             message = "站点信息已更新"
         elif action == "update_admin_token":
             new_token = form.get("new_token", "").strip()
@@ -868,83 +3522,30 @@ async def admin_action(request):
             if wants_json(request):
                 return web.json_response({"ok": True, "action": "update_admin_token", "message": message})
         elif action == "generate_playlist_image":
-            bg_field = form.get("bg_image")
-            if not (bg_field and hasattr(bg_field, "file") and bg_field.filename):
-                raise ValueError("请上传背景图")
-            try:
-                content_start = int(form.get("content_start", 0))
-                end_start = int(form.get("end_start", 0))
-            except Exception:
-                raise ValueError("content_start/end_start 需要是整数")
-            songs_sorted = await fetch_songs_sorted(conn)
-            names = [s["name"] for s in songs_sorted]
-            font_path = form.get("font_path", "").strip() or None
-            font_size = int(form.get("font_size", 38) or 38)
-            line_height = form.get("line_height")
-            line_height_val = int(line_height) if line_height else None
-            max_chars_per_line = int(form.get("max_chars_per_line", 35) or 35)
-            max_songs_per_line = int(form.get("max_songs_per_line", 6) or 6)
-            generated_path = generate_playlist_image_from_bg(
-                bg_field.file.read(),
-                content_start,
-                end_start,
-                names,
-                font_path=font_path,
-                font_size=font_size,
-                max_chars_per_line=max_chars_per_line,
-                max_songs_per_line=max_songs_per_line,
-                line_height=line_height_val,
-            )
-            if wants_json(request):
-                return web.json_response({"ok": True, "action": "generate_playlist_image", "path": generated_path})
-            # For normal form submit, stream the generated file as download
-            fs_path = generated_path.lstrip("/\\")
-            fs_path = fs_path if os.path.isabs(fs_path) else os.path.join(os.getcwd(), fs_path)
-            if not os.path.exists(fs_path):
-                raise web.HTTPNotFound(text="生成的长图不存在")
-            filename = os.path.basename(fs_path)
-            headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
-            return web.FileResponse(path=fs_path, headers=headers)
+            bg_bytes = read_background_field(form, "bg_image")
+            options = parse_playlist_image_options(form)
+            options["max_height"] = request.app["config"].render_options()["max_image_height"]
+            async with request.app["db_readers"].acquire() as reader:
+                names = [s["name"] for s in await fetch_songs_sorted(reader)]
+            job = submit_render_job(request.app, "playlist_image", bg_bytes, names, options)
+            return render_job_submitted(request, "generate_playlist_image", job)
         elif action == "generate_playlist_pages":
-            bg_field = form.get("bg_image_small")
-            if not (bg_field and hasattr(bg_field, "file") and bg_field.filename):
-                raise ValueError("请上传背景图")
-            try:
-                x1 = int(form.get("rect_x1", 0))
-                y1 = int(form.get("rect_y1", 0))
-                x2 = int(form.get("rect_x2", 0))
-                y2 = int(form.get("rect_y2", 0))
-            except Exception:
-                raise ValueError("矩形坐标需要是整数")
-            font_size = int(form.get("font_size", 38) or 38)
-            line_height = int(form.get("line_height", 80) or 80)
-            max_chars_per_line = int(form.get("max_chars_per_line", 35) or 35)
-            max_songs_per_line = int(form.get("max_songs_per_line", 6) or 6)
-            songs_sorted = await fetch_songs_sorted(conn)
-            names = [s["name"] for s in songs_sorted]
-            font_path = form.get("font_path", "").strip() or None
-            result = generate_playlist_pages_from_bg(
-                bg_field.file.read(),
-                (x1, y1, x2, y2),
-                names,
-                font_path=font_path,
-                font_size=font_size,
-                max_chars_per_line=max_chars_per_line,
-                max_songs_per_line=max_songs_per_line,
-                line_height=line_height,
-            )
-            zip_path = result["zip_path"]
-            if wants_json(request):
-                return web.json_response({"ok": True, "action": "generate_playlist_pages", "zip_path": zip_path, "files": result["files"]})
-            fs_path = zip_path.lstrip("/\\")
-            fs_path = fs_path if os.path.isabs(fs_path) else os.path.join(os.getcwd(), fs_path)
-            if not os.path.exists(fs_path):
-                raise web.HTTPNotFound(text="生成的文件不存在")
-            filename = os.path.basename(fs_path)
-            headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
-            return web.FileResponse(path=fs_path, headers=headers)
+            bg_bytes = read_background_field(form, "bg_image_small")
+            options = parse_playlist_pages_options(form)
+            async with request.app["db_readers"].acquire() as reader:
+                names = [s["name"] for s in await fetch_songs_sorted(reader)]
+            job = submit_render_job(request.app, "playlist_pages", bg_bytes, names, options)
+            return render_job_submitted(request, "generate_playlist_pages", job)
+        elif action in ("preview_playlist_image", "preview_playlist_pages"):
+            return await render_preview_response(request, form, action)
         else:
             message = "未知操作"
+    except PreviewBackgroundExpired as exc:
+        return web.json_response({"ok": False, "bg_expired": True, "message": str(exc)}, status=409)
+    except RenderBusyError as exc:
+        message = str(exc)
+        if wants_json(request):
+            return web.json_response({"ok": False, "busy": True, "message": message}, status=503, headers={"Retry-After": "10"})
     except Exception as exc:
         message = f"操作失败: {exc}"
         if wants_json(request):
@@ -956,14 +3557,266 @@ async def admin_action(request):
     return web.HTTPFound(location="/admin?" + "&".join(params) + "#songs")
 
 
+async def admin_batch(request):
+    """POST /admin/batch: JSON ``{"ops": [...]}`` of song create/update/delete applied in one transaction.
+
+    CSRF comes from the X-CSRF-Token header (checked by csrf_middleware).
+    """
+    _ = require_admin(request)
+    try:
+        payload = await request.json()
+    except ValueError:
+        return web.json_response({"ok": False, "message": "请求体不是合法的 JSON"}, status=400)
+    ops = payload.get("ops") if isinstance(payload, dict) else payload
+    if not isinstance(ops, list) or not ops:
+        return web.json_response({"ok": False, "message": "ops 应为非空数组"}, status=400)
+    if len(ops) > BATCH_MAX_OPS:
+        return web.json_response({"ok": False, "message": f"单次最多 {BATCH_MAX_OPS} 项操作"}, status=400)
+    items, results = validate_song_batch(ops)
+    if any(result["status"] == "error" for result in results):
+        for result in results:
+            if result["status"] == "ok":
+                result["status"] = "skipped"
+        return web.json_response({"ok": False, "message": "部分操作格式有误，未做任何修改", "results": results}, status=400)
+    async with request.app["write_lock"]:
+        applied = await apply_song_batch(request.app["db_conn"], items, results)
+    if applied:
+        return web.json_response({"ok": True, "message": f"已提交 {len(results)} 项修改", "results": results})
+    return web.json_response({"ok": False, "message": "批量修改未生效，已整体回滚", "results": results}, status=409)
+
+
+def read_background_field(form, field):
+    bg_field = form.get(field)
+    if not (bg_field and hasattr(bg_field, "file") and bg_field.filename):
+        raise ValueError("请上传背景图")
+    return bg_field.file.read()
+
+
+def parse_output_options(form):
+    output_format = form.get("output_format") or "png"
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("不支持的输出格式")
+    try:
+        compress_level = int(form.get("compress_level") or 6)
+        target_kb = int(form.get("target_kb") or 0) or None
+    except ValueError:
+        raise ValueError("压缩级别/目标大小需要是整数")
+    if not 0 <= compress_level <= 9:
+        raise ValueError("PNG 压缩级别需在 0-9 之间")
+    return {"output_format": output_format, "compress_level": compress_level, "target_kb": target_kb}
+
+
+def parse_playlist_image_options(form):
+    try:
+        content_start = int(form.get("content_start", 0))
+        end_start = int(form.get("end_start", 0))
+    except Exception:
+        raise ValueError("content_start/end_start 需要是整数")
+    line_height = form.get("line_height")
+    return {
+        "content_start": content_start,
+        "end_start": end_start,
+        "font_path": form.get("font_path", "").strip() or None,
+        "font_size": int(form.get("font_size", 38) or 38),
+        "max_chars_per_line": int(form.get("max_chars_per_line") or 0) or None,
+        "max_songs_per_line": int(form.get("max_songs_per_line", 6) or 6),
+        "line_height": int(line_height) if line_height else None,
+        **parse_output_options(form),
+    }
+
+
+def parse_playlist_pages_options(form):
+    try:
+        x1 = int(form.get("rect_x1", 0))
+        y1 = int(form.get("rect_y1", 0))
+        x2 = int(form.get("rect_x2", 0))
+        y2 = int(form.get("rect_y2", 0))
+    except Exception:
+        raise ValueError("矩形坐标需要是整数")
+    return {
+        "rect": (x1, y1, x2, y2),
+        "font_path": form.get("font_path", "").strip() or None,
+        "font_size": int(form.get("font_size", 38) or 38),
+        "max_chars_per_line": int(form.get("max_chars_per_line") or 0) or None,
+        "max_songs_per_line": int(form.get("max_songs_per_line", 6) or 6),
+        "line_height": int(form.get("line_height", 80) or 80),
+        "persist_pages": form.get("persist_pages") in ("1", "on", "true"),
+        **parse_output_options(form),
+    }
+
+
+async def render_preview_response(request, form, action):
+    """Preview image for the generate forms; the background is sent once, then referenced by bg_token."""
+    previews = request.app["preview_backgrounds"]
+    if action == "preview_playlist_image":
+        kind, field, options = "playlist_image", "bg_image", parse_playlist_image_options(form)
+    else:
+        kind, field, options = "playlist_pages", "bg_image_small", parse_playlist_pages_options(form)
+    bg_field = form.get(field)
+    if bg_field is not None and hasattr(bg_field, "file") and bg_field.filename:
+        token = await asyncio.to_thread(previews.put, bg_field.file.read())
+    else:
+        token = form.get("bg_token", "")
+    entry = previews.get(token)
+    async with request.app["db_readers"].acquire() as conn:
+        snapshot = await get_catalog_snapshot(conn)
+    names = [s["name"] for s in snapshot["songs"]]
+    fmt = "webp" if form.get("preview_format") == "webp" else "jpeg"
+    started = time.perf_counter()
+    body = await asyncio.to_thread(render_preview, entry, kind, names, options, fmt)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return web.Response(
+        body=body,
+        content_type=f"image/{fmt}",
+        headers={"X-Bg-Token": token, "X-Render-Ms": f"{elapsed_ms:.1f}", "Cache-Control": "no-store"},
+    )
+
+
+async def admin_stream_playlist_pages(request):
+    """Render the paginated playlist and stream the zip straight back (no job, no files)."""
+    form = await request.post()
+    require_admin(request, form)
+    try:
+        bg_bytes = read_background_field(form, "bg_image_small")
+        options = parse_playlist_pages_options(form)
+    except ValueError as exc:
+        raise web.HTTPBadRequest(text=str(exc))
+    async with request.app["db_readers"].acquire() as conn:
+        names = [s["name"] for s in await fetch_songs_sorted(conn)]
+    try:
+        return await stream_playlist_pages(request, bg_bytes, names, options)
+    except RenderBusyError as exc:
+        raise web.HTTPServiceUnavailable(text=str(exc), headers={"Retry-After": "10"})
+    except ValueError as exc:
+        raise web.HTTPBadRequest(text=str(exc))
+
+
+def render_job_submitted(request, action, job):
+    message = "渲染任务已提交，可在“渲染任务”中查看进度并下载"
+    if wants_json(request):
+        return web.json_response(
+            {
+                "ok": True,
+                "action": action,
+                "job_id": job["id"],
+                "status_url": f"/admin/jobs/{job['id']}",
+                "message": message,
+            },
+            status=202,
+        )
+    return web.HTTPFound(location="/admin?message=" + quote(message) + "#jobs")
+
+
+async def admin_jobs(request):
+    _ = require_admin(request)
+    jobs = request.app["render_jobs"].recent()
+    return web.json_response({"ok": True, "jobs": [public_job(job) for job in jobs]})
+
+
+async def admin_job_status(request):
+    _ = require_admin(request)
+    job = request.app["render_jobs"].get(request.match_info["job_id"])
+    if job is None:
+        raise web.HTTPNotFound(text="任务不存在或已过期")
+    return web.json_response({"ok": True, "job": public_job(job)})
+
+
+async def admin_job_download(request):
+    _ = require_admin(request)
+    job = request.app["render_jobs"].get(request.match_info["job_id"])
+    if job is None:
+        raise web.HTTPNotFound(text="任务不存在或已过期")
+    if job["status"] != "done":
+        raise web.HTTPConflict(text="任务尚未完成")
+    result = job["result"] or {}
+    web_path = result.get("zip_path") or result.get("path")
+    if not web_path:
+        raise web.HTTPNotFound(text="该任务没有可下载的文件")
+    fs_path = os.path.join(os.getcwd(), web_path.lstrip("/\\"))
+    if not os.path.exists(fs_path):
+        raise web.HTTPNotFound(text="生成的文件不存在")
+    filename = os.path.basename(fs_path)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    return web.FileResponse(path=fs_path, headers=headers)
+
+
+async def write_backup_export(conn, fp, fmt="json", use_gzip=False):
+    """Write a full backup export in ``fmt`` (optionally gzipped) to the binary file ``fp``."""
+    if fmt == "xlsx":
+        await export_backup_xlsx(conn, fp)
+        return
+    chunks = iter_backup_chunks(conn, fmt)
+    if use_gzip:
+        chunks = iter_gzip_chunks(chunks)
+    try:
+        async for chunk in chunks:
+            fp.write(chunk)
+    finally:
+        await chunks.aclose()
+
+
+async def iter_file_chunks(fp, chunk_size=64 * 1024):
+    fp.seek(0)
+    while True:
+        chunk = await asyncio.to_thread(fp.read, chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
 async def admin_download_backup(request):
-    """Generate and send latest backup file for download."""
+    """Stream a backup export: ?format=json|ndjson|xlsx, &gzip=1 for a .gz file (json/ndjson only)."""
     _ = require_admin(request)
-    conn = request.app["db_conn"]
-    dest = os.path.join("backup", "songs_backup.json")
-    saved = await backup_songs(conn, dest)
-    headers = {"Content-Disposition": 'attachment; filename="songs_backup.json"'}
-    return web.FileResponse(path=saved, headers=headers)
+    fmt = request.query.get("format", "json")
+    if fmt not in BACKUP_FORMATS:
+        raise web.HTTPBadRequest(text="format 仅支持 json、ndjson 或 xlsx")
+    ext, content_type = BACKUP_FORMATS[fmt]
+    filename = f"songs_backup.{ext}"
+    # xlsx 本身就是 zip，不再套 gzip
+    use_gzip = request.query.get("gzip") in ("1", "true") and fmt != "xlsx"
+    if use_gzip:
+        filename += ".gz"
+        content_type = "application/gzip"
+    response = web.StreamResponse(
+        headers={
+            "Content-Type": content_type,
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "no-store",
+        }
+    )
+    response.enable_chunked_encoding()
+    with tempfile.TemporaryFile() as tmp:
+        # 先在只读连接的同一个快照里把整份导出写进临时文件，随即归还连接；
+        # 之后再按客户端的速度发送，慢速或中途断开的下载不会一直占着读连接
+        async with request.app["db_readers"].acquire() as conn:
+            await write_backup_export(conn, tmp, fmt, use_gzip)
+        chunks = iter_file_chunks(tmp)
+        try:
+            await response.prepare(request)
+            async for chunk in chunks:
+                await response.write(chunk)
+        finally:
+            await chunks.aclose()
+    await response.write_eof()
+    return response
+
+
+async def admin_cache_stats(request):
+    """Expose in-process cache counters (admin only)."""
+    _ = require_admin(request)
+    return web.json_response(
+        {
+            "catalog": catalog_cache_stats(),
+            "settings": settings_cache_stats(),
+            "page": response_cache_stats(PAGE_CACHE),
+            "catalog_json": response_cache_stats(CATALOG_JSON_CACHE),
+            "image_proxy": request.app["image_proxy"].cache_stats(),
+            "render_pool": request.app["render_pool"].stats(),
+            "preview_backgrounds": request.app["preview_backgrounds"].stats(),
+            "db_readers": request.app["db_readers"].stats(),
+            "fonts": load_font.cache_info()._asdict(),
+        }
+    )
 
 
 async def init_app():
@@ -978,11 +3831,21 @@ async def init_app():
     app.router.add_get("/healthz", lambda request: web.Response(text="ok"))
 
     config = Config("config.ini")
-    db_conn = await create_db_connection(config.db_path())
+    db_options = config.database_options()
+    db_conn = await create_db_connection(config.db_path(), db_options)
     app["db_conn"] = db_conn
+    # 写连接由所有请求共享：未提交的事务对同一连接上的其他写入可见，commit 也会一并提交。
+    # 因此每个写事务（单条增删改、站点信息、批量修改、恢复、xlsx 导入）都要先拿到这把锁
+    app["write_lock"] = asyncio.Lock()
+    app["db_readers"] = await ReadPool.open(db_conn, config.db_path(), db_options["read_connections"], db_options)
     app["config"] = config
+    app.cleanup_ctx.append(image_proxy_ctx)
+    app.cleanup_ctx.append(render_pool_ctx)
 
     app.router.add_get("/", index)
+    app.router.add_get("/api/songs", api_songs_catalog)
+    app.router.add_get("/api/songs/search", api_search_songs)
+    app.router.add_get("/api/songs/changes", api_song_changes)
     app.router.add_get("/admin/login", admin_login_get)
     app.router.add_post("/admin/login", admin_login_post)
     app.router.add_get("/admin/logout", admin_logout)
@@ -990,15 +3853,107 @@ async def init_app():
     app.router.add_post("/admin/setup", admin_setup_post)
     app.router.add_get("/admin", admin_page)
     app.router.add_post("/admin/action", admin_action)
+    app.router.add_post("/admin/batch", admin_batch)
+    app.router.add_post("/admin/playlist-pages.zip", admin_stream_playlist_pages)
     app.router.add_get("/admin/download-backup", admin_download_backup)
+    app.router.add_get("/admin/cache-stats", admin_cache_stats)
+    app.router.add_get("/admin/jobs", admin_jobs)
+    app.router.add_get("/admin/jobs/{job_id}", admin_job_status)
+    app.router.add_get("/admin/jobs/{job_id}/download", admin_job_download)
 
     async def close_db(app):
+        await app["db_readers"].close()
         await app["db_conn"].close()
 
     app.on_cleanup.append(close_db)
     return app
 
 
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s[%(process)d]: %(message)s"
+WORKER_RESTART_MAX_DELAY = 30  # seconds
+
+
+async def migrate_database(config):
+    """Run migrations once in the supervisor so workers start against an up-to-date schema."""
+    conn = await create_db_connection(config.db_path(), config.database_options())
+    await conn.close()
+
+
+def run_worker(port, index):
+    """Entry point of one worker process: a full app listening on the shared port."""
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    # 只让第一个 worker 打印监听地址
+    web.run_app(init_app(), port=port, reuse_port=True, print=print if index == 0 else None)
+
+
+def serve_workers(port, workers):
+    """Pre-fork supervisor: keep ``workers`` processes serving ``port`` and restart any that exit.
+
+    Every worker binds the port with SO_REUSEPORT and the kernel spreads
+    connections across them. A worker that dies soon after starting is
+    restarted with exponential backoff (up to WORKER_RESTART_MAX_DELAY).
+    SIGINT/SIGTERM stop all workers.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    slots = {index: {"process": None, "started": 0.0, "delay": 0, "restart_at": 0.0} for index in range(workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    def start(index):
+        process = ctx.Process(target=run_worker, args=(port, index), name=f"qqzhu-worker-{index}")
+        process.start()
+        slots[index].update(process=process, started=time.monotonic())
+        logger.info("worker %d 已启动（pid %d）", index, process.pid)
+
+    for index in slots:
+        start(index)
+    while not stopping:
+        sentinels = [slot["process"].sentinel for slot in slots.values() if slot["process"] is not None]
+        multiprocessing.connection.wait(sentinels, timeout=1.0)
+        now = time.monotonic()
+        for index, slot in slots.items():
+            if stopping:
+                break
+            process = slot["process"]
+            if process is not None and not process.is_alive():
+                # 启动后很快就退出的 worker（如端口占用、配置错误）按指数退避重启，避免空转
+                if now - slot["started"] < 10:
+                    slot["delay"] = min(max(slot["delay"] * 2, 1), WORKER_RESTART_MAX_DELAY)
+                else:
+                    slot["delay"] = 0
+                slot.update(process=None, restart_at=now + slot["delay"])
+                logger.warning(
+                    "worker %d（pid %d）退出，退出码 %s，%d 秒后重启", index, process.pid, process.exitcode, slot["delay"]
+                )
+            if slot["process"] is None and now >= slot["restart_at"]:
+                start(index)
+    logger.info("正在停止 %d 个 worker", workers)
+    for slot in slots.values():
+        if slot["process"] is not None and slot["process"].is_alive():
+            slot["process"].terminate()
+    for slot in slots.values():
+        if slot["process"] is not None:
+            slot["process"].join(timeout=15)
+            if slot["process"].is_alive():
+                slot["process"].kill()
+
+
 if __name__ == "__main__":
-    port = Config("config.ini").server_port()
-    web.run_app(init_app(), port=port)
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    config = Config("config.ini")
+    port = config.server_port()
+    workers = config.workers()
+    if workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        logger.warning("当前平台不支持 SO_REUSEPORT，改为单进程运行")
+        workers = 1
+    if workers > 1:
+        asyncio.run(migrate_database(config))
+        serve_workers(port, workers)
+    else:
+        web.run_app(init_app(), port=port)
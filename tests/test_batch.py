@@ -0,0 +1,58 @@
+import asyncio
+import os
+import sys
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import Config, add_song, admin_batch, create_db_connection  # noqa: E402
+
+TOKEN = "test-token"
+
+
+def song(name, artist):
+    return {"name": name, "artist": artist, "language": "国语", "genre": "流行", "url": "-"}
+
+
+def test_unknown_id_rolls_back_whole_batch(monkeypatch):
+    monkeypatch.setenv("QQZHU_ADMIN_TOKEN", TOKEN)
+
+    async def run():
+        conn = await create_db_connection(":memory:", Config().database_options())
+        app = web.Application()
+        app["config"] = Config()
+        app["db_conn"] = conn
+        app["write_lock"] = asyncio.Lock()
+        app.router.add_post("/admin/batch", admin_batch)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            song_id = await add_song(conn, "青花瓷", "周杰伦", "国语", "流行", "-")
+            ops = [
+                {"op": "create", "song": song("晴天", "周杰伦")},
+                {"op": "update", "id": song_id, "song": song("青花瓷", "周杰伦 Jay")},
+                {"op": "delete", "id": song_id + 100},
+                {"op": "delete", "id": song_id},
+            ]
+            async with aiohttp.ClientSession() as session:
+                async with session.post(
+                    server.make_url("/admin/batch"), json={"ops": ops}, headers={"X-Admin-Token": TOKEN}
+                ) as resp:
+                    status, body = resp.status, await resp.json()
+            cursor = await conn.execute("SELECT id, name, artist FROM songs")
+            rows = [tuple(row) for row in await cursor.fetchall()]
+            await cursor.close()
+            return song_id, status, body, rows
+        finally:
+            await server.close()
+            await conn.close()
+
+    song_id, status, body, rows = asyncio.run(run())
+    assert status == 409
+    assert body["ok"] is False
+    assert [result["status"] for result in body["results"]] == ["rolled_back", "rolled_back", "error", "skipped"]
+    assert body["results"][0]["id"] is None
+    assert rows == [(song_id, "青花瓷", "周杰伦")]
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import (  # noqa: E402
+    Config,
+    add_song,
+    create_db_connection,
+    delete_song,
+    fetch_song_changes,
+    prune_song_tombstones,
+)
+
+
+async def open_catalog():
+    conn = await create_db_connection(":memory:", Config().database_options())
+    first = await add_song(conn, "青花瓷", "周杰伦", "国语", "流行", "-")
+    second = await add_song(conn, "稻香", "周杰伦", "国语", "流行", "-")
+    return conn, first, second
+
+
+def test_delete_shows_up_as_tombstone():
+    async def run():
+        conn, first, second = await open_catalog()
+        try:
+            since = (await fetch_song_changes(conn, 0))["version"]
+            await delete_song(conn, first)
+            return first, await fetch_song_changes(conn, since)
+        finally:
+            await conn.close()
+
+    deleted_id, changes = asyncio.run(run())
+    assert changes["reset"] is False
+    assert changes["deleted"] == [deleted_id]
+    assert changes["songs"] == []
+
+
+def test_since_before_changes_from_resets():
+    async def run():
+        conn, first, second = await open_catalog()
+        try:
+            since = (await fetch_song_changes(conn, 0))["version"]
+            await delete_song(conn, first)
+            # 墓碑过期被清理后，旧版本的增量已不完整
+            await prune_song_tombstones(conn, retention=-1)
+            await conn.commit()
+            return second, await fetch_song_changes(conn, since)
+        finally:
+            await conn.close()
+
+    remaining_id, changes = asyncio.run(run())
+    assert changes["reset"] is True
+    assert changes["deleted"] == []
+    assert [song[changes["fields"].index("id")] for song in changes["songs"]] == [remaining_id]
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import sys
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import ImageProxy  # noqa: E402
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"0" * 64
+
+
+async def start_upstream(handler):
+    app = web.Application()
+    app.router.add_get("/img.png", handler)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+def test_stale_entry_is_revalidated_with_etag(tmp_path):
+    seen = []
+
+    async def handler(request):
+        seen.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304, headers={"Cache-Control": "max-age=60"})
+        return web.Response(
+            body=PNG, content_type="image/png", headers={"ETag": '"v1"', "Cache-Control": "max-age=0"}
+        )
+
+    async def main():
+        upstream = await start_upstream(handler)
+        async with aiohttp.ClientSession() as session:
+            proxy = ImageProxy(session, str(tmp_path))
+            url = str(upstream.make_url("/img.png"))
+            first = await proxy.get(url)
+            second = await proxy.get(url)
+            third = await proxy.get(url)
+        await upstream.close()
+        return proxy, first, second, third
+
+    proxy, first, second, third = asyncio.run(main())
+    assert seen == [None, '"v1"']
+    assert first["body"] == second["body"] == third["body"] == PNG
+    assert second["etag"] == '"v1"'
+    assert proxy.stats["misses"] == 1
+    assert proxy.stats["revalidated"] == 1
+    assert proxy.stats["memory_hits"] == 1
+
+
+def test_concurrent_requests_share_one_upstream_fetch(tmp_path):
+    calls = []
+
+    async def handler(request):
+        calls.append(request.path)
+        await asyncio.sleep(0.1)
+        return web.Response(body=PNG, content_type="image/png", headers={"Cache-Control": "max-age=60"})
+
+    async def main():
+        upstream = await start_upstream(handler)
+        async with aiohttp.ClientSession() as session:
+            proxy = ImageProxy(session, str(tmp_path))
+            url = str(upstream.make_url("/img.png"))
+            entries = await asyncio.gather(*[proxy.get(url) for _ in range(10)])
+        await upstream.close()
+        return proxy, entries
+
+    proxy, entries = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(entry["body"] == PNG for entry in entries)
+    assert proxy.stats["misses"] == 1
+    assert proxy.stats["shared_inflight"] == 9
@@ -0,0 +1,35 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import Config, add_song, create_db_connection, restore_songs_from_data  # noqa: E402
+
+
+def song(name, artist, genre="流行"):
+    return {"name": name, "artist": artist, "language": "国语", "genre": genre, "url": "-"}
+
+
+def test_merge_counts_inserted_updated_and_unchanged():
+    async def run():
+        conn = await create_db_connection(":memory:", Config().database_options())
+        try:
+            await add_song(conn, "青花瓷", "周杰伦", "国语", "流行", "-")
+            await add_song(conn, "稻香", "周杰伦", "国语", "流行", "-")
+            await add_song(conn, "后来", "刘若英", "国语", "流行", "-")
+            stats = await restore_songs_from_data(
+                conn,
+                [song("青花瓷", "周杰伦"), song("稻香", "周杰伦", genre="民谣"), song("晴天", "周杰伦")],
+                mode="merge",
+            )
+            cursor = await conn.execute("SELECT name, genre FROM songs ORDER BY id")
+            rows = [tuple(row) for row in await cursor.fetchall()]
+            await cursor.close()
+            return stats, rows
+        finally:
+            await conn.close()
+
+    stats, rows = asyncio.run(run())
+    assert (stats["total"], stats["inserted"], stats["updated"], stats["unchanged"], stats["deleted"]) == (3, 1, 1, 1, 0)
+    assert rows == [("青花瓷", "流行"), ("稻香", "民谣"), ("后来", "流行"), ("晴天", "流行")]
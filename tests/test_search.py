@@ -0,0 +1,22 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import Config, add_song, create_db_connection, search_songs  # noqa: E402
+
+
+def test_pinyin_initials_match_chinese_title():
+    async def run():
+        conn = await create_db_connection(":memory:", Config().database_options())
+        try:
+            await add_song(conn, "青花瓷", "周杰伦", "国语", "流行", "-")
+            await add_song(conn, "稻香", "周杰伦", "国语", "流行", "-")
+            return await search_songs(conn, "qhc")
+        finally:
+            await conn.close()
+
+    total, songs = asyncio.run(run())
+    assert total == 1
+    assert songs[0]["name"] == "青花瓷"
@@ -0,0 +1,73 @@
+"""
+Benchmark index.html rendering time against catalog size.
+
+Builds synthetic catalogs (songs spread over a number of language tags),
+groups them the same way the server snapshot does, and renders the real
+templates/index.html. Time per song should stay roughly flat as the
+catalog grows (linear total render time).
+
+Example:
+python tools/bench_index_render.py --sizes 1000,2000,4000,8000 --languages 12
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import jinja2
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+if str(REPO_DIR) not in sys.path:
+    sys.path.append(str(REPO_DIR))
+
+from server import DEFAULT_SETTINGS, group_songs_by_language  # noqa: E402
+
+
+def build_catalog(size: int, language_count: int):
+    languages = [f"语言{i}" for i in range(language_count)]
+    songs = [
+        {
+            "id": i + 1,
+            "name": f"歌曲{i}",
+            "artist": f"歌手{i % 97}",
+            "language": languages[i % language_count],
+            "genre": f"风格{i % 7}",
+            "url": "-" if i % 3 else "https://example.com",
+        }
+        for i in range(size)
+    ]
+    return songs, languages
+
+
+def render_once(template, songs, languages) -> float:
+    start = time.perf_counter()
+    template.render(
+        songs=songs,
+        songs_by_language=group_songs_by_language(songs, languages),
+        languages=languages,
+        genres=sorted({s["genre"] for s in songs}),
+        settings=DEFAULT_SETTINGS,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure index.html render time vs catalog size.")
+    parser.add_argument("--sizes", default="500,1000,2000,4000,8000", help="Comma separated catalog sizes.")
+    parser.add_argument("--languages", type=int, default=12, help="Number of distinct language tags.")
+    parser.add_argument("--repeat", type=int, default=5, help="Renders per size (median is reported).")
+    args = parser.parse_args()
+
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(str(REPO_DIR / "templates")), autoescape=True)
+    template = env.get_template("index.html")
+    print(f"{'songs':>8} {'median ms':>10} {'us/song':>8}")
+    for size in [int(x) for x in args.sizes.split(",") if x.strip()]:
+        songs, languages = build_catalog(size, args.languages)
+        timings = [render_once(template, songs, languages) for _ in range(args.repeat)]
+        median = statistics.median(timings)
+        print(f"{size:>8} {median * 1000:>10.1f} {median / size * 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()